@@ -0,0 +1,121 @@
+"""
+Накладные расходы диспетчера на текстовые кнопки меню: цепочка хендлеров с
+lambda-фильтрами (как было) против TextCommands (поиск по словарю).
+
+    python benchmarks/dispatch_bench.py --updates 20000
+
+Хендлеры пустые, поэтому меряется только выбор хендлера aiogram-ом.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.fsm.state import State, StatesGroup  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+from commands import TextCommands  # noqa: E402
+from report import percentile, print_comparison, save_results  # noqa: E402
+
+SEARCH_BUTTONS = ["Иконка или заглушка", "Найти компонент"]
+MENU_BUTTONS = ["Изучить гайды", "Предложить доработку", "Добавить иконку или логотип",
+                "Посмотреть последние изменения", "Поддержка", "FAQ"]
+MESSAGES = {"first button": SEARCH_BUTTONS[0], "last button": MENU_BUTTONS[-1], "not a button": "привет"}
+
+
+class Flow(StatesGroup):
+    choose_type = State()
+    input_query = State()
+    show_more = State()
+
+
+async def noop(message):
+    pass
+
+
+def add_state_handlers(dp):
+    for state in (Flow.choose_type, Flow.input_query, Flow.show_more):
+        dp.message.register(noop, state)
+
+
+def legacy_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    for label in SEARCH_BUTTONS:
+        dp.message.register(noop, lambda msg, label=label.lower(): msg.text and msg.text.lower() == label)
+    add_state_handlers(dp)
+    for label in MENU_BUTTONS:
+        dp.message.register(noop, lambda msg, label=label.lower(): msg.text and msg.text.lower() == label)
+    return dp
+
+
+def router_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    search_commands, menu_commands = TextCommands(), TextCommands()
+    for label in SEARCH_BUTTONS:
+        search_commands.command(label)(noop)
+    search_commands.register(dp.message)
+    add_state_handlers(dp)
+    for label in MENU_BUTTONS:
+        menu_commands.command(label)(noop)
+    menu_commands.register(dp.message)
+    return dp
+
+
+def make_update(bot, update_id: int, text: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Bench"},
+        },
+    }, context={"bot": bot})
+
+
+async def measure(dp, bot, text: str, count: int) -> dict:
+    updates = [make_update(bot, i, text) for i in range(count)]
+    for update in updates[:200]:  # прогрев
+        await dp.feed_update(bot, update)
+    latencies = []
+    for update in updates:
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    return {"p50_us": percentile(latencies, 50), "p99_us": percentile(latencies, 99),
+            "mean_us": sum(latencies) / len(latencies)}
+
+
+async def run(args) -> dict:
+    bot = Bot(token="1:bench")
+    results = {}
+    for name, dp in (("legacy", legacy_dispatcher()), ("router", router_dispatcher())):
+        results[name] = {label: await measure(dp, bot, text, args.updates) for label, text in MESSAGES.items()}
+    await bot.session.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--compare", help="файл прошлых результатов")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(f"{'dispatcher':<12}{'message':<16}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+    for name, by_message in results.items():
+        for label, stats in by_message.items():
+            print(f"{name:<12}{label:<16}{stats['mean_us']:>10.1f}{stats['p50_us']:>10.1f}{stats['p99_us']:>10.1f}")
+
+    print("\nСохранено:", save_results("dispatch_bench", results, args))
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Локальные заглушки внешних сервисов для бенчмарков и нагрузочных тестов:
+Bot API, сервер CSV каталога и лист Google Sheets.
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import itertools
+import json
+import time
+
+from aiohttp import web
+
+
+class FakeTelegram:
+    """
+    Bot API на aiohttp: отвечает на методы, которые вызывает бот, с задержкой
+    latency. retry_after_every — каждый n-й запрос получает 429.
+    """
+
+    def __init__(self, latency: float = 0.0, retry_after_every: int = 0):
+        self.latency = latency
+        self.retry_after_every = retry_after_every
+        self.calls = {}
+        self.requests = 0
+        self.message_ids = itertools.count(1)
+        self.runner = None
+
+    def message(self, chat_id, **extra):
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            **extra,
+        }
+
+    def photo(self, chat_id):
+        message_id = next(self.message_ids)
+        return self.message(chat_id, photo=[{
+            "file_id": f"file{message_id}", "file_unique_id": f"u{message_id}", "width": 1, "height": 1
+        }])
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        self.calls[method] = self.calls.get(method, 0) + 1
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.retry_after_every and self.requests % self.retry_after_every == 0:
+            return web.json_response({
+                "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            })
+
+        chat_id = data.get("chat_id", 1)
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif method in ("setWebhook", "deleteWebhook", "answerInlineQuery", "answerCallbackQuery"):
+            result = True
+        elif method == "sendMediaGroup":
+            result = [self.photo(chat_id) for _ in json.loads(data["media"])]
+        elif method == "sendPhoto":
+            result = self.photo(chat_id)
+        else:
+            result = self.message(chat_id, text=data.get("text", ""))
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port)
+        await site.start()
+        return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class FakeCsvServer:
+    """Отдаёт CSV каталога с ETag и отвечает 304 на условный запрос"""
+
+    def __init__(self, records: list, latency: float = 0.0):
+        self.latency = latency
+        self.hits = 0
+        self.not_modified = 0
+        self.runner = None
+        self.set_records(records)
+
+    def set_records(self, records: list):
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=list(records[0]))
+        writer.writeheader()
+        writer.writerows(records)
+        self.text = out.getvalue()
+        self.etag = '"%s"' % hashlib.md5(self.text.encode("utf-8")).hexdigest()
+
+    async def handle(self, request):
+        self.hits += 1
+        if request.headers.get("If-None-Match") == self.etag:
+            self.not_modified += 1
+            return web.Response(status=304)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(text=self.text, headers={"ETag": self.etag})
+
+    async def start(self, port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get("/components.csv", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port)
+        await site.start()
+        return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/components.csv"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class FakeWorksheet:
+    """Лист Google Sheets: append_rows копит строки, как будто запрос занял latency секунд"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.rows = []
+        self.calls = 0
+
+    def append_rows(self, rows, value_input_option=None):
+        # Вызывается из пула потоков бота, поэтому блокирующий sleep
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self.rows.extend(rows)
+
+
+def make_bot(base: str, session_class=None):
+    """Bot, который ходит в FakeTelegram по адресу base; session_class — класс сессии aiogram"""
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    return Bot(
+        token="1:bench",
+        default=DefaultBotProperties(parse_mode="HTML"),
+        session=(session_class or AiohttpSession)(api=TelegramAPIServer.from_base(base))
+    )
@@ -0,0 +1,121 @@
+"""
+Проверка инкрементального обновления индекса: каталог много раз подряд
+случайно правится, индекс патчится через SearchIndex.updated, и после каждого
+раунда сравнивается с индексом, построенным с нуля по тем же строкам.
+
+    python benchmarks/index_consistency.py --rows 3000 --rounds 30
+
+Сравниваются число записей, словарь и выдача по каждому запросу для каждого
+типа, в том числе порядок (_ordered_ids для дописанных в конец записей).
+Завершается с кодом 1 при первом расхождении.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import Component, diff_catalog  # noqa: E402
+from search import SearchIndex, ids_to_mask, sort_key  # noqa: E402
+from search_bench import FILES, make_catalog, make_queries  # noqa: E402
+
+TYPES = (None, "web", "mobile", "icon")
+
+
+def record_type(r) -> str:
+    # Как component_type в bot.py
+    if r["File"] == "App Components":
+        return "mobile"
+    if r["File"] in ("Icons", "Placeholders"):
+        return "icon"
+    return "web"
+
+
+def edit_catalog(rows: list, vocabulary: list, edits: int, round_: int, rng: random.Random) -> list:
+    """Копия каталога со случайными правками: теги, переименования, удаления, новые строки"""
+    rows = rows[:]
+    rng.shuffle(rows)  # порядок строк в таблице на индекс влиять не должен
+    for _ in range(edits):
+        k = rng.randrange(len(rows))
+        r = rows[k]
+        kind = rng.random()
+        if kind < 0.3:
+            tags = f"{r.Tags}, {rng.choice(vocabulary)}x{round_}"
+            rows[k] = Component(r.Component, r.File, tags, r.Link, r.Image)
+        elif kind < 0.5:
+            rows[k] = Component(f"{rng.choice(vocabulary).title()}/New", r.File, r.Tags, r.Link, r.Image)
+        elif kind < 0.7:
+            del rows[k]
+        else:
+            rows.append(Component(
+                f"{rng.choice(vocabulary).title()}/Add{round_}", rng.choice(FILES),
+                f"{rng.choice(vocabulary)}, новыйтег{round_}", f"https://figma.example/{round_}/{k}", ""
+            ))
+    return rows
+
+
+def mismatches(patched: SearchIndex, fresh: SearchIndex, queries: list) -> list:
+    """Запросы, по которым выдача двух индексов различается"""
+    failed = []
+    if len(patched) != len(fresh):
+        failed.append(("len", len(patched), len(fresh)))
+    if sorted(patched.vocabulary) != sorted(fresh.vocabulary):
+        failed.append(("vocabulary", len(patched.vocabulary), len(fresh.vocabulary)))
+
+    # Весь каталог в порядке названий — так его видит бот без запроса
+    live = ids_to_mask(i for i, r in enumerate(patched.records) if r is not None)
+    if [sort_key(patched.records[i]) for i in patched._ordered_ids(live)] != sorted(map(sort_key, fresh.records)):
+        failed.append(("order", None, None))
+
+    for query in queries:
+        for type_ in TYPES:
+            # Одинаковые названия могут идти в любом порядке, поэтому сравниваются ключи сортировки
+            got = [sort_key(patched.records[i]) for i in patched.search(query, type_)]
+            expected = [sort_key(fresh.records[i]) for i in fresh.search(query, type_)]
+            if got != expected:
+                failed.append((query, type_, len(got), len(expected)))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--edits", type=int, default=60, help="максимум правок за раунд")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    records, vocabulary, weights = make_catalog(args.rows, rng)
+    rows = [Component(r["Component"], r["File"], r["Tags"], r["Link"], r["Image"]) for r in records]
+    queries = make_queries(vocabulary, weights, args.queries, rng)
+
+    index = SearchIndex(rows, record_type)
+    for round_ in range(args.rounds):
+        rows = edit_catalog(index.live_records(), vocabulary, rng.randint(1, args.edits), round_, rng)
+        diff = diff_catalog(index.live_records(), rows)
+
+        started = time.perf_counter()
+        index = index.updated(diff.removed_records(), diff.added_records(), record_type)
+        patch_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        fresh = SearchIndex(rows, record_type)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        # Новые теги раунда тоже ищутся: их нет в словаре исходного каталога
+        failed = mismatches(index, fresh, queries + [f"новыйтег{round_}", f"add{round_}"])
+        print(f"round {round_}: changes={len(diff)} patch={patch_ms:.1f}ms build={build_ms:.1f}ms "
+              f"fragmentation={index.fragmentation:.3f} mismatches={len(failed)}")
+        if failed:
+            for item in failed[:10]:
+                print("  ", item)
+            sys.exit(1)
+
+    print(f"OK: {args.rounds} раундов, индекс после патчей совпадает с построенным заново")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Бенчмарк загрузки каталога: прежний путь (весь текст CSV -> csv.DictReader,
+словарь на строку) против потокового CatalogParser с записями Component.
+
+    python benchmarks/ingest_bench.py --rows 100000
+
+Печатает время разбора, пиковую и оставшуюся память Python-кучи (tracemalloc).
+"""
+import argparse
+import csv
+import gc
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from catalog import CatalogParser  # noqa: E402
+from report import print_comparison, save_results  # noqa: E402
+from search_bench import make_catalog  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_csv(rows: int, seed: int) -> bytes:
+    records = make_catalog(rows, random.Random(seed))[0]
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(records[0]) + ["Owner", "Comment"])
+    writer.writeheader()
+    for record in records:
+        # В настоящей таблице есть колонки, которые бот не читает
+        writer.writerow({**record, "Owner": "design-system", "Comment": ""})
+    return out.getvalue().encode("utf-8")
+
+
+def legacy_ingest(data: bytes) -> list:
+    """Как было: resp.text() целиком, затем DictReader по StringIO"""
+    text = data.decode("utf-8")
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def streaming_ingest(data: bytes) -> list:
+    """Как сейчас: куски ответа сразу уходят в парсер"""
+    parser = CatalogParser()
+    for start in range(0, len(data), CHUNK_SIZE):
+        parser.feed(data[start:start + CHUNK_SIZE])
+    return parser.close()
+
+
+def measure(ingest, data: bytes) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    rows = ingest(data)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    return {"parse_ms": elapsed * 1000, "peak_mb": peak / 2 ** 20, "retained_mb": retained / 2 ** 20}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--compare", help="файл прошлых результатов")
+    args = parser.parse_args()
+
+    data = make_csv(args.rows, args.seed)
+    results = {
+        "csv_mb": len(data) / 2 ** 20,
+        "legacy": measure(legacy_ingest, data),
+        "streaming": measure(streaming_ingest, data),
+    }
+
+    print(f"CSV: {args.rows} строк, {results['csv_mb']:.1f}MB")
+    print(f"{'path':<12}{'parse ms':>10}{'peak MB':>10}{'retained MB':>13}")
+    for name in ("legacy", "streaming"):
+        stats = results[name]
+        print(f"{name:<12}{stats['parse_ms']:>10.0f}{stats['peak_mb']:>10.1f}{stats['retained_mb']:>13.1f}")
+
+    print("\nСохранено:", save_results("ingest_bench", results, args))
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
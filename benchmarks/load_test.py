@@ -0,0 +1,264 @@
+"""
+Нагрузочный тест: синтетические пользователи шлют апдейты через dp бота,
+Bot API, CSV каталога и Google Sheets заменены локальными заглушками.
+
+    python benchmarks/load_test.py --users 2000 --rows 10000 --concurrency 200
+
+Печатает апдейты в секунду, p50/p99 по хендлерам и рост памяти; результат
+сохраняется в benchmarks/results/ (--compare — сравнить с прошлым файлом).
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fakes import FakeCsvServer, FakeTelegram, FakeWorksheet, make_bot  # noqa: E402
+from report import percentile, print_comparison, save_results  # noqa: E402
+from search_bench import make_catalog, make_queries  # noqa: E402
+
+TYPE_BUTTONS = ["Мобильный компонент", "Веб-компонент", "Иконка или заглушка"]
+STATIC_COMMANDS = ["/start", "Изучить гайды", "FAQ", "Поддержка", "Посмотреть последние изменения"]
+
+
+def configure_environment(workdir: str, fsm_storage: str):
+    """Настройки бота читаются при импорте, поэтому задаются до import bot"""
+    os.environ.setdefault("BOT_TOKEN", "1:bench")
+    os.environ["LOG_SPOOL_PATH"] = os.path.join(workdir, "log_spool.sqlite3")
+    os.environ["CATALOG_SNAPSHOT_PATH"] = os.path.join(workdir, "catalog_snapshot.pickle")
+    os.environ["FILE_ID_CACHE_PATH"] = os.path.join(workdir, "file_id_cache.json")
+    os.environ["FSM_STORAGE"] = fsm_storage
+    os.environ["FSM_STORAGE_PATH"] = os.path.join(workdir, "fsm.sqlite3")
+    os.environ["RATE_LIMIT_DB_PATH"] = os.path.join(workdir, "ratelimit.sqlite3")
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class HandlerTimer:
+    """Inner-middleware: точное время каждого вызова хендлера для перцентилей"""
+
+    def __init__(self):
+        self.durations = {}
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.durations.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+
+
+class UpdateFactory:
+    def __init__(self, bot_instance):
+        self.bot = bot_instance
+        self.ids = itertools.count(1)
+
+    def user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"}
+
+    def message(self, user_id: int, text: str):
+        from aiogram.types import Update
+        return Update.model_validate({
+            "update_id": next(self.ids),
+            "message": {
+                "message_id": next(self.ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self.user(user_id),
+                "text": text,
+            },
+        }, context={"bot": self.bot})
+
+    def inline_query(self, user_id: int, query: str, offset: str = ""):
+        from aiogram.types import Update
+        return Update.model_validate({
+            "update_id": next(self.ids),
+            "inline_query": {"id": str(next(self.ids)), "from": self.user(user_id), "query": query, "offset": offset},
+        }, context={"bot": self.bot})
+
+
+def make_scenarios(users: int, queries: list, rng: random.Random) -> list:
+    """Для каждого пользователя — последовательность апдейтов: (вид, текст)"""
+    scenarios = []
+    for user_id in range(1, users + 1):
+        kind = rng.random()
+        query = rng.choice(queries)
+        if kind < 0.5:
+            steps = [("message", "Найти компонент"), ("message", rng.choice(TYPE_BUTTONS)),
+                     ("message", query), ("message", "Да"), ("message", "Нет"), ("message", "Отмена")]
+        elif kind < 0.75:
+            steps = [("inline", query), ("inline_next", query)]
+        else:
+            steps = [("message", command) for command in rng.sample(STATIC_COMMANDS, 3)]
+        scenarios.append((1000 + user_id, steps))
+    return scenarios
+
+
+async def run_user(bot_module, factory, user_id, steps, counter):
+    next_offset = ""
+    for kind, text in steps:
+        if kind == "message":
+            update = factory.message(user_id, text)
+        elif kind == "inline":
+            update = factory.inline_query(user_id, text)
+        else:
+            if not next_offset:
+                continue
+            update = factory.inline_query(user_id, text, next_offset)
+        await bot_module.dp.feed_update(bot_module.bot, update)
+        counter[0] += 1
+        if kind == "inline":
+            page = bot_module.inline_pages.get((bot_module.component_csv_hash, " ".join(text.lower().split()), 0))
+            next_offset = page[1] if page else ""
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="bot-load-")
+    configure_environment(workdir, args.fsm_storage)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import bot as bot_module
+        import metrics
+
+    rng = random.Random(args.seed)
+    records, vocabulary, weights = make_catalog(args.rows, rng)
+    queries = make_queries(vocabulary, weights, 2000, rng)
+
+    telegram = FakeTelegram(latency=args.telegram_latency_ms / 1000)
+    csv_server = FakeCsvServer(records)
+    base = await telegram.start()
+    bot_module.CSV_URL = await csv_server.start()
+    # Как в боте: Bot API через общий пул соединений
+    bot_module.bot = make_bot(base, bot_module.SharedAiohttpSession)
+    bot_module.bot.session.middleware(metrics.TelegramMetricsMiddleware())
+    worksheet = FakeWorksheet(latency=args.sheets_latency_ms / 1000)
+    bot_module.sheets_worksheet = worksheet
+    if not args.telegram_limits:
+        # Меряем сам бот, а не паузы под лимиты Bot API
+        bot_module.send_scheduler = bot_module.SendScheduler(1e9, 1e9, 10 ** 9, bot_module.TELEGRAM_MAX_RETRIES)
+
+    timer = HandlerTimer()
+    for event_type, observer in bot_module.dp.observers.items():
+        if event_type != "update":
+            observer.middleware(timer)
+
+    factory = UpdateFactory(bot_module.bot)
+    scenarios = make_scenarios(args.users, queries, rng)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_start = rss_mb()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        await bot_module.on_startup()
+        started = time.perf_counter()
+        await bot_module.get_component_data()
+        catalog_load_ms = (time.perf_counter() - started) * 1000
+        rss_warm = rss_mb()
+        heap_warm = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+
+        counter = [0]
+        slots = asyncio.Semaphore(args.concurrency)
+
+        async def limited(user_id, steps):
+            async with slots:
+                await run_user(bot_module, factory, user_id, steps, counter)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(user_id, steps) for user_id, steps in scenarios))
+        elapsed = time.perf_counter() - started
+
+        while len(bot_module.get_log_spool()):
+            if not await bot_module.flush_logs():
+                break
+
+    rss_end = rss_mb()
+    heap_end = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+
+    handlers = {
+        name: {"calls": len(values), "p50_ms": percentile(values, 50), "p99_ms": percentile(values, 99)}
+        for name, values in sorted(timer.durations.items())
+    }
+    results = {
+        "updates": counter[0],
+        "updates_per_sec": counter[0] / elapsed,
+        "elapsed_s": elapsed,
+        "catalog_load_ms": catalog_load_ms,
+        "rss_mb": {"start": rss_start, "warm": rss_warm, "end": rss_end, "growth": rss_end - rss_warm},
+        "handlers": handlers,
+        "telegram_requests": telegram.requests,
+        "log_rows_written": len(worksheet.rows),
+        "rate_limit_rejections": sum(
+            sample.value for metric in metrics.rate_limit_rejections.collect()
+            for sample in metric.samples if sample.name.endswith("_total")
+        ),
+    }
+    if args.tracemalloc:
+        results["python_heap_mb"] = {"warm": heap_warm / 2 ** 20, "end": heap_end / 2 ** 20,
+                                     "growth": (heap_end - heap_warm) / 2 ** 20}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        await bot_module.on_shutdown()
+    await bot_module.bot.session.close()
+    await telegram.stop()
+    await csv_server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=200, help="пользователей одновременно")
+    parser.add_argument("--fsm-storage", default="memory", choices=["memory", "sqlite"])
+    parser.add_argument("--telegram-latency-ms", type=float, default=0)
+    parser.add_argument("--sheets-latency-ms", type=float, default=0)
+    parser.add_argument("--telegram-limits", action="store_true", help="соблюдать лимиты Bot API")
+    parser.add_argument("--tracemalloc", action="store_true", help="мерить рост Python-кучи (медленнее)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--compare", help="файл прошлых результатов")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(f"updates={results['updates']} elapsed={results['elapsed_s']:.2f}s "
+          f"throughput={results['updates_per_sec']:.0f} updates/s catalog_load={results['catalog_load_ms']:.0f}ms")
+    rss = results["rss_mb"]
+    print(f"rss: start={rss['start']:.1f}MB warm={rss['warm']:.1f}MB end={rss['end']:.1f}MB "
+          f"growth={rss['growth']:+.1f}MB")
+    if "python_heap_mb" in results:
+        print(f"python heap growth: {results['python_heap_mb']['growth']:+.1f}MB")
+    print(f"telegram_requests={results['telegram_requests']} log_rows={results['log_rows_written']} "
+          f"rate_limited={results['rate_limit_rejections']:.0f}")
+    print(f"\n{'handler':<24}{'calls':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, stats in results["handlers"].items():
+        print(f"{name:<24}{stats['calls']:>8}{stats['p50_ms']:>10.3f}{stats['p99_ms']:>10.3f}")
+
+    print("\nСохранено:", save_results("load_test", results, args))
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Микробенчмарки горячих функций бота: search_components на каталогах разного
+размера, обновление каталога на несколько строк, can_proceed и add_to_buffer.
+
+    python benchmarks/micro_bench.py --rows 1000 10000 100000
+
+Результат сохраняется в benchmarks/results/ (--compare — сравнить с прошлым файлом).
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from load_test import configure_environment  # noqa: E402
+from report import percentile, print_comparison, save_results  # noqa: E402
+from search_bench import make_catalog, make_queries  # noqa: E402
+
+TYPES = ["mobile", "web", "icon"]
+
+
+def latency_stats(latencies: list) -> dict:
+    return {
+        "ops_per_sec": len(latencies) / (sum(latencies) / 1000),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+async def bench_search(bot, rows: int, count: int, rng: random.Random) -> dict:
+    records, vocabulary, weights = make_catalog(rows, rng)
+    started = time.perf_counter()
+    index = bot.build_search_index(records)
+    build_ms = (time.perf_counter() - started) * 1000
+    bot.publish_catalog(index, f"bench-{rows}")
+    bot.last_fetch_time = time.time()
+
+    queries = make_queries(vocabulary, weights, count, rng)
+    types = [rng.choice(TYPES) for _ in queries]
+    for query in queries[:200]:  # прогрев
+        await bot.search_components(query, rng.choice(TYPES))
+
+    async def measure():
+        latencies = []
+        for query, type_ in zip(queries, types):
+            started = time.perf_counter()
+            await bot.search_components(query, type_)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latency_stats(latencies)
+
+    # Сначала сам индекс (кэш результатов выключен), затем с кэшем
+    cache_size = bot.SEARCH_CACHE_SIZE
+    bot.SEARCH_CACHE_SIZE = 0
+    uncached = await measure()
+    bot.SEARCH_CACHE_SIZE = cache_size
+    bot.search_cache.clear()
+    bot.search_cache_ids = 0
+    return {"build_ms": build_ms, **uncached, "cached": await measure()}
+
+
+def bench_catalog_update(bot, rows: int, changes: int, rng: random.Random) -> dict:
+    """Обновление CSV, в котором поменялись changes строк: патч индекса против полной перестройки"""
+    records = make_catalog(rows, rng)[0]
+    index = bot.build_search_index(records)
+    updated = [dict(r) for r in records]
+    for r in rng.sample(updated, changes):
+        r["Tags"] += ", обновлено"
+
+    started = time.perf_counter()
+    bot.update_search_index(index, updated)
+    update_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    bot.build_search_index(updated)
+    rebuild_ms = (time.perf_counter() - started) * 1000
+    return {"update_ms": update_ms, "rebuild_ms": rebuild_ms}
+
+
+async def bench_can_proceed(bot, users: int, count: int, rng: random.Random) -> dict:
+    usernames = [f"user{i}" for i in range(users)]
+    latencies = []
+    for _ in range(count):
+        username = rng.choice(usernames)
+        started = time.perf_counter()
+        await bot.can_proceed(username)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latency_stats(latencies)
+
+
+def bench_add_to_buffer(bot, count: int) -> dict:
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(count):
+            started = time.perf_counter()
+            bot.add_to_buffer(f"user{i % 1000}", "Поисковой запрос: кнопка (тип: web)")
+            latencies.append((time.perf_counter() - started) * 1000)
+    return latency_stats(latencies)
+
+
+async def run(args) -> dict:
+    configure_environment(tempfile.mkdtemp(prefix="bot-micro-"), "memory")
+    with contextlib.redirect_stdout(io.StringIO()):
+        import bot
+
+    rng = random.Random(args.seed)
+    results = {"search_components": {}}
+    for rows in args.rows:
+        results["search_components"][str(rows)] = await bench_search(bot, rows, args.queries, rng)
+    results["catalog_update"] = bench_catalog_update(bot, args.rows[-1], args.changes, rng)
+    results["can_proceed"] = await bench_can_proceed(bot, args.users, args.calls, rng)
+    results["add_to_buffer"] = bench_add_to_buffer(bot, args.calls)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--changes", type=int, default=20, help="строк, изменившихся при обновлении каталога")
+    parser.add_argument("--queries", type=int, default=3000)
+    parser.add_argument("--users", type=int, default=10000, help="разных пользователей для can_proceed")
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--compare", help="файл прошлых результатов")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(f"{'benchmark':<28}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for rows, stats in results["search_components"].items():
+        print(f"{'search_components ' + rows:<28}{stats['ops_per_sec']:>12.0f}"
+              f"{stats['p50_ms']:>10.4f}{stats['p99_ms']:>10.4f}   build {stats['build_ms']:.0f}ms")
+        cached = stats["cached"]
+        print(f"{'  с кэшем результатов':<28}{cached['ops_per_sec']:>12.0f}"
+              f"{cached['p50_ms']:>10.4f}{cached['p99_ms']:>10.4f}")
+    update = results["catalog_update"]
+    print(f"{'catalog_update ' + str(args.rows[-1]):<28}update {update['update_ms']:.0f}ms "
+          f"(полная перестройка {update['rebuild_ms']:.0f}ms)")
+    for name in ("can_proceed", "add_to_buffer"):
+        stats = results[name]
+        print(f"{name:<28}{stats['ops_per_sec']:>12.0f}{stats['p50_ms']:>10.4f}{stats['p99_ms']:>10.4f}")
+
+    print("\nСохранено:", save_results("micro_bench", results, args))
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Микробенчмарк rate limiter-а: стоимость одного апдейта и память на число
+разных пользователей.
+
+    python benchmarks/rate_limit_bench.py --users 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import RateLimiter  # noqa: E402
+
+COUNT, INTERVAL = 5, 10
+
+
+class LegacyLimiter:
+    """Прежняя реализация: список временных меток на пользователя, без вытеснения"""
+
+    def __init__(self):
+        self.user_timestamps = {}
+
+    def allow(self, username, now):
+        timestamps = [t for t in self.user_timestamps.get(username, []) if now - t < INTERVAL]
+        if len(timestamps) >= COUNT:
+            self.user_timestamps[username] = timestamps
+            return False
+        timestamps.append(now)
+        self.user_timestamps[username] = timestamps
+        return True
+
+
+def run(make_limiter, users: int, updates: int, seed: int):
+    """
+    Поток апдейтов от users пользователей за 60 секунд модельного времени.
+    Время и память меряются в разных прогонах: tracemalloc сильно замедляет код.
+    """
+    rng = random.Random(seed)
+    keys = [f"user{i}" for i in range(users)]
+    stream = [rng.choice(keys) for _ in range(updates)]
+    step = 60 / updates
+
+    def replay(limiter):
+        now = 0.0
+        for key in stream:
+            now += step
+            limiter.allow(key, now)
+        return limiter
+
+    started = time.perf_counter()
+    replay(make_limiter())
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    limiter = replay(make_limiter())
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed / updates * 1e9, memory, limiter
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--updates", type=int, default=300000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'impl':>12} {'ns/update':>10} {'memory':>10} {'keys':>8}")
+    for users in args.users:
+        for name, make_limiter in (("legacy", LegacyLimiter),
+                                   ("token_bucket", lambda: RateLimiter(COUNT / INTERVAL, COUNT))):
+            ns, memory, limiter = run(make_limiter, users, args.updates, args.seed)
+            keys = len(limiter.user_timestamps if name == "legacy" else limiter.buckets)
+            print(f"{users:>8} {name:>12} {ns:>10.0f} {memory / 1024 / 1024:>8.1f}MB {keys:>8}")
+
+    # Вытеснение: после простоя дольше burst / rate в лимитере не остаётся ключей
+    limiter = RateLimiter(COUNT / INTERVAL, COUNT)
+    for i in range(max(args.users)):
+        limiter.allow(f"user{i}", 0.0)
+    before = len(limiter)
+    started = time.perf_counter()
+    evicted = limiter.evict_idle(INTERVAL + 1)
+    print(f"evict_idle: {evicted}/{before} keys in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Сохранение результатов бенчмарков для сравнения между коммитами.
+
+Результаты пишутся в benchmarks/results/<имя>-<коммит>.json; --compare
+указывает на прошлый файл, и к каждому числу печатается изменение.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(RESULTS_DIR)
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True,
+            cwd=os.path.dirname(RESULTS_DIR)
+        ).stdout.strip()
+        return f"{revision}-dirty" if dirty else revision
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(name: str, results: dict, args) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    revision = git_revision()
+    path = os.path.join(RESULTS_DIR, f"{name}-{revision}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "benchmark": name,
+            "revision": revision,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "machine": platform.machine(),
+            "args": vars(args),
+            "results": results,
+        }, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def print_comparison(results: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline['revision']} ({baseline['date']}):")
+    old = flatten(baseline["results"])
+    for key, value in flatten(results).items():
+        if key not in old:
+            continue
+        before = old[key]
+        change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"  {key:<48} {before:>12.4g} -> {value:<12.4g} {change}")
@@ -0,0 +1,138 @@
+"""
+Бенчмарк поискового индекса на синтетическом каталоге.
+
+    python benchmarks/search_bench.py --rows 20000
+
+Запрос меряется так, как его выполняет бот: поиск плюс первая страница
+результатов. Два прохода: warm — кэши разбора слов индекса прогреты, cold —
+кэши очищаются перед каждым запросом. Завершается с кодом 1, если p99
+любого прохода превышает бюджет (1 мс).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report import percentile, print_comparison, save_results  # noqa: E402
+from search import SearchIndex  # noqa: E402
+
+FILES = ["App Components", "Icons", "Placeholders", "Web Components", "Web Molecules", "Web Organisms"]
+SYLLABLES_RU = ["ка", "но", "пк", "та", "бы", "по", "ле", "ме", "ню", "ки", "ко", "ро", "ст", "ре", "ла"]
+SYLLABLES_EN = ["but", "ton", "in", "put", "tab", "card", "mo", "dal", "chip", "bar", "nav", "list", "row"]
+
+
+def make_vocabulary(size: int, rng: random.Random) -> list:
+    words = set()
+    while len(words) < size:
+        syllables = SYLLABLES_RU if rng.random() < 0.5 else SYLLABLES_EN
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_catalog(rows: int, rng: random.Random) -> tuple:
+    """
+    Каталог, похожий на настоящий: компоненты сгруппированы в семейства
+    (кнопки, поля, табы...), размер семейств распределён по Ципфу. У каждого
+    семейства свои общие теги, у варианта — ещё пара уточняющих.
+    """
+    vocabulary = make_vocabulary(max(1000, rows // 4), rng)
+    families = [rng.sample(vocabulary, 3) for _ in range(max(50, rows // 60))]
+    family_weights = [1 / (rank + 1) for rank in range(len(families))]
+
+    records = []
+    for i in range(rows):
+        family = rng.choices(families, family_weights)[0]
+        variant = rng.sample(vocabulary, 2)
+        records.append({
+            "Component": f"{family[0].title()}/{variant[0].title()}/{rng.choice(['S', 'M', 'L'])}",
+            "File": rng.choice(FILES),
+            "Tags": ", ".join(family + [f"{family[0]} {variant[1]}"] + variant[1:]),
+            "Link": f"https://www.figma.com/design/bench?node-id={i}",
+            "Image": f'=IMAGE("https://example.com/{i}.png")',
+        })
+
+    # Запросы чаще всего — про популярные семейства
+    query_words = [f[0] for f in families] + vocabulary
+    query_weights = family_weights + [0.5 / len(vocabulary)] * len(vocabulary)
+    return records, query_words, query_weights
+
+
+def make_queries(vocabulary: list, weights: list, count: int, rng: random.Random) -> list:
+    queries = []
+    for _ in range(count):
+        word = rng.choices(vocabulary, weights)[0]
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(word)
+        elif kind < 0.55:
+            queries.append(word[:max(2, len(word) // 2)])
+        elif kind < 0.7 and len(word) >= 4:
+            pos = rng.randrange(len(word))
+            queries.append(word[:pos] + rng.choice("абвxyz") + word[pos + 1:])
+        elif kind < 0.9:
+            queries.append(f"{word} {rng.choices(vocabulary, weights)[0]}")
+        else:
+            queries.append("несуществующийкомпонент")
+    return queries
+
+
+def measure(index, queries: list, types: list, page: int, cold: bool) -> dict:
+    latencies = []
+    for query, type_ in zip(queries, types):
+        if cold:
+            index._token_cache.clear()
+            index._word_cache.clear()
+        started = time.perf_counter()
+        index.search(query, type_)[:page]
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {"p50_ms": percentile(latencies, 50), "p99_ms": percentile(latencies, 99), "max_ms": max(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    parser.add_argument("--page", type=int, default=10, help="результатов на странице бота")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--compare", help="файл прошлых результатов")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    records, vocabulary, weights = make_catalog(args.rows, rng)
+
+    started = time.perf_counter()
+    index = SearchIndex(records, lambda r: "mobile" if r["File"] == "App Components" else
+                        "icon" if r["File"] in ("Icons", "Placeholders") else "web")
+    build_ms = (time.perf_counter() - started) * 1000
+
+    queries = make_queries(vocabulary, weights, args.queries, rng)
+    types = [rng.choice(["mobile", "web", "icon"]) for _ in queries]
+    for query, type_ in zip(queries[:200], types):  # прогрев
+        index.search(query, type_)[:args.page]
+
+    results = {"build_ms": build_ms, "vocabulary": len(index.vocabulary)}
+    for name in ("warm", "cold"):
+        results[name] = measure(index, queries, types, args.page, cold=name == "cold")
+
+    print(f"rows={args.rows} vocabulary={len(index.vocabulary)} build={build_ms:.0f}ms queries={len(queries)}")
+    for name in ("warm", "cold"):
+        stats = results[name]
+        print(f"{name}: p50={stats['p50_ms']:.3f}ms p99={stats['p99_ms']:.3f}ms max={stats['max_ms']:.3f}ms")
+
+    print("\nСохранено:", save_results("search_bench", results, args))
+    if args.compare:
+        print_comparison(results, args.compare)
+
+    failed = [name for name in ("warm", "cold") if results[name]["p99_ms"] > args.budget_ms]
+    for name in failed:
+        print(f"FAIL: {name} p99 {results[name]['p99_ms']:.3f}ms > {args.budget_ms}ms")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,93 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # время импорта модуля попадает в сводку старта
+
 import os
 import aiohttp
 import asyncio
 import json
 import functools
+import hashlib
+import pickle
+import random
+import sqlite3
 from aiogram import Bot, Dispatcher, types
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import (
+    ReplyKeyboardMarkup, KeyboardButton, InputMediaPhoto, InlineQueryResultArticle,
+    InlineQueryResultPhoto, InlineQueryResultCachedPhoto, InputTextMessageContent, BufferedInputFile
+)
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.client.default import DefaultBotProperties
-from aiogram.filters import Command
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
-import csv
-import io
-import time
+from aiogram.dispatcher.event.handler import HandlerObject
+from collections import Counter, OrderedDict, deque
 from datetime import datetime
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
+import signal
+import threading
+from ratelimit import RateLimiter, SQLiteRateLimiter, RedisRateLimiter
+from search import SearchIndex, normalize
+from catalog import CatalogParser, diff_catalog
+from commands import TextCommands, split_message
+from storage import create_storage
+import metrics
+from profiling import SamplingProfiler, SlowCallTracer, set_slow_callback_detection
+from lifecycle import InFlightUpdates, StartupTimer, embedded_server
+
+# --- Процессы и общее состояние ---
+# WORKERS > 1 — несколько процессов за webhook-эндпоинтом. Тогда лимиты и FSM
+# живут в общем хранилище: sqlite (процессы на одной машине) или redis.
+WORKERS = int(os.getenv("WORKERS", 1))
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite" if WORKERS > 1 else "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+redis_client = None
+
+def get_redis():
+    """Клиент Redis, общий для лимитов и FSM; redis нужен только в этом режиме"""
+    global redis_client
+    if redis_client is None:
+        from redis.asyncio import Redis
+        redis_client = Redis.from_url(REDIS_URL, decode_responses=True)
+    return redis_client
 
 # --- Rate Limiting ---
-user_timestamps = {}  # username -> list of временные метки
 RATE_LIMIT_COUNT = 5  # сколько сообщений можно отправлять за интервал
 RATE_LIMIT_INTERVAL = 10  # интервал в секундах
 
-def can_proceed(username: str) -> bool:
+# Лимиты по типу апдейта: (сколько запросов, за сколько секунд)
+RATE_LIMITS = {
+    "message": (RATE_LIMIT_COUNT, RATE_LIMIT_INTERVAL),
+    "callback_query": (10, 10),
+    "inline_query": (20, 10),
+    "chosen_inline_result": (20, 10),
+}
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", STATE_BACKEND)
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "ratelimit.sqlite3")
+
+def make_rate_limiter(count: int, interval: float, name: str = "message"):
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteRateLimiter(RATE_LIMIT_DB_PATH, name, rate=count / interval, burst=count)
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimiter(get_redis(), name, rate=count / interval, burst=count)
+    return RateLimiter(rate=count / interval, burst=count)
+
+message_limiter = make_rate_limiter(RATE_LIMIT_COUNT, RATE_LIMIT_INTERVAL)
+
+async def limiter_allows(limiter, key) -> bool:
+    # У общих лимитеров allow асинхронный
+    allowed = limiter.allow(key)
+    if not isinstance(allowed, bool):
+        allowed = await allowed
+    return allowed
+
+async def can_proceed(username: str) -> bool:
     """Проверяет, можно ли пользователю отправить новое сообщение"""
-    now = time.time()
-    timestamps = user_timestamps.get(username, [])
-    
-    # оставляем только последние сообщения в интервале
-    timestamps = [t for t in timestamps if now - t < RATE_LIMIT_INTERVAL]
-    
-    if len(timestamps) >= RATE_LIMIT_COUNT:
-        # превышен лимит
-        user_timestamps[username] = timestamps  # обновляем очищенный список
-        return False
-    
-    # добавляем новую отметку времени
-    timestamps.append(now)
-    user_timestamps[username] = timestamps
-    return True
+    return await limiter_allows(message_limiter, username)
 
 
 # --- Настройки ---
@@ -50,13 +99,82 @@ GOOGLE_SHEET_KEY = "1xNtFTHDf2HzzPqO4sckikDtFc8LLjArPoH0t9YLw2po"
 GOOGLE_SHEET_TAB_NAME = "Logs"
 GOOGLE_SHEETS_CREDS = os.getenv("GOOGLE_SHEETS_CREDS")
 
+# --- HTTP-клиент ---
+# Одна сессия с пулом keep-alive соединений и DNS-кэшем на все исходящие запросы
+HTTP_LIMIT = int(os.getenv("HTTP_LIMIT", 100))  # всего соединений в пуле
+# Основной хост пула — api.telegram.org, поэтому по умолчанию ему доступен весь пул
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", HTTP_LIMIT))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", 300))  # секунд
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+
+http_session = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Возвращает общую HTTP-сессию, создавая её при первом обращении"""
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+    return http_session
+
+async def close_http_session():
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+class SharedAiohttpSession(AiohttpSession):
+    """
+    Сессия aiogram поверх общей HTTP-сессии: запросы к Bot API идут через
+    тот же пул соединений и DNS-кэш, что и остальные исходящие запросы
+    """
+
+    async def create_session(self):
+        return get_http_session()
+
+    async def close(self):
+        # Закрывает общую сессию: после остановки бота (или после set_webhook,
+        # который работает в отдельном event loop) её нельзя переиспользовать.
+        # Кто обратится к ней позже, получит новую.
+        await close_http_session()
+
 bot = Bot(
     token=BOT_TOKEN,
-    default=DefaultBotProperties(parse_mode="HTML")
+    default=DefaultBotProperties(parse_mode="HTML"),
+    session=SharedAiohttpSession(timeout=HTTP_TIMEOUT)
+)
+# --- FSM-хранилище ---
+# memory — только в процессе; sqlite и redis переживают перезапуск бота
+FSM_STORAGE = os.getenv("FSM_STORAGE", STATE_BACKEND)
+FSM_STORAGE_PATH = os.getenv("FSM_STORAGE_PATH", "fsm.sqlite3")
+FSM_TTL = float(os.getenv("FSM_TTL", 24 * 60 * 60))  # брошенная сессия живёт сутки
+FSM_MEMORY_MAX_KEYS = int(os.getenv("FSM_MEMORY_MAX_KEYS", 10000))
+FSM_PURGE_INTERVAL = 600
+
+storage = create_storage(
+    FSM_STORAGE, ttl=FSM_TTL, max_keys=FSM_MEMORY_MAX_KEYS, sqlite_path=FSM_STORAGE_PATH,
+    redis=get_redis() if FSM_STORAGE == "redis" else None, shared=WORKERS > 1
 )
-storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+async def fsm_storage_purger():
+    while True:
+        await asyncio.sleep(FSM_PURGE_INTERVAL)
+        try:
+            await storage.purge_expired()
+        except Exception as e:
+            print("Ошибка очистки FSM-хранилища:", e)
+
 # --- Middleware для rate limiting ---
 from aiogram import BaseMiddleware
 from aiogram.types import Update
@@ -65,6 +183,14 @@ from typing import Callable, Any
 HandlerType = Callable[[Update, dict], Any]
 
 class RateLimitMiddleware(BaseMiddleware):
+    def __init__(self, limits: dict = None):
+        limits = RATE_LIMITS if limits is None else limits
+        # Сообщения делят лимитер с can_proceed; для остальных типов — свои
+        self.limiters = {
+            update_type: message_limiter if update_type == "message" else make_rate_limiter(*limit, update_type)
+            for update_type, limit in limits.items()
+        }
+
     async def __call__(self, handler: HandlerType, event: Update, data: dict):
         user = None
 
@@ -80,8 +206,11 @@ class RateLimitMiddleware(BaseMiddleware):
             user = event.poll_answer.user
 
         if user:
+            # Для типов без своего лимита действует лимит сообщений
+            limiter = self.limiters.get(event.event_type, message_limiter)
             username_or_id = user.username or str(user.id)
-            if not can_proceed(username_or_id):
+            if not await limiter_allows(limiter, username_or_id):
+                metrics.rate_limit_rejections.labels(event.event_type).inc()
                 if event.message:
                     await event.message.answer("⏳ Слишком много запросов. Подождите немного.")
                 elif event.callback_query:
@@ -96,6 +225,8 @@ class RateLimitMiddleware(BaseMiddleware):
 
 # Регистрируем middleware в Dispatcher
 dp.update.middleware(RateLimitMiddleware())
+# Время хендлеров и запросов к Bot API — для /metrics
+metrics.instrument(dp, bot)
 
 # --- Инициализация Google Sheets ---
 def init_google_sheets():
@@ -103,7 +234,11 @@ def init_google_sheets():
         if not GOOGLE_SHEETS_CREDS:
             print("Google Sheets credentials not found in environment variables")
             return None
-            
+
+        # gspread и oauth2client импортируются долго и нужны только лидеру — грузим при первом подключении
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+
         scope = ['https://spreadsheets.google.com/feeds',
                  'https://www.googleapis.com/auth/drive']
         
@@ -117,60 +252,224 @@ def init_google_sheets():
         print(f"Error initializing Google Sheets: {e}")
     return None
 
-# --- Логирование через буфер ---
-log_buffer = []
+# --- Логирование через спул ---
+# Логи сначала пишутся в локальный SQLite-спул ограниченного размера и
+# переживают перезапуск. Отправкой в Google Sheets занимается один log_worker.
+LOG_SPOOL_PATH = os.getenv("LOG_SPOOL_PATH", "log_spool.sqlite3")
 LOG_INTERVAL = 300  # 5 минут
-MAX_BUFFER_SIZE = 20  # Максимальный размер буфера перед принудительной отправкой
+MAX_BUFFER_SIZE = 20  # Размер спула, при котором отправляем сразу, не дожидаясь LOG_INTERVAL
+LOG_BATCH_SIZE = 500  # Максимум строк за одну запись в Google Sheets
+LOG_SPOOL_MAX_ROWS = int(os.getenv("LOG_SPOOL_MAX_ROWS", 10000))
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "drop_oldest")  # drop_oldest | drop_newest | sample
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.1))  # доля новых записей, сохраняемых при переполнении
+LOG_BACKOFF_BASE = 5  # секунд до первой повторной отправки после ошибки
+LOG_BACKOFF_MAX = 600
+LOG_POLL_INTERVAL = 5  # как часто проверять размер спула, в который пишут и другие процессы
+# Спул пишется прямо из хендлеров в event loop: дольше этого ждать блокировку
+# файла (её держит другой процесс) нельзя — строка лога отбрасывается
+LOG_SPOOL_BUSY_TIMEOUT = 0.05  # секунд
+
+
+class LogSpool:
+    """
+    Ограниченная по размеру очередь строк лога в SQLite. shared — в тот же
+    файл пишут несколько процессов, и размер приходится перечитывать из базы.
+    """
+
+    def __init__(self, path: str, max_rows: int, policy: str = "drop_oldest", sample_rate: float = 0.1,
+                 shared: bool = False):
+        self.max_rows = max_rows
+        self.shared = shared
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self.size = 0  # если база занята уже при открытии, refresh оставит эту оценку
+
+        self.db = sqlite3.connect(path, timeout=LOG_SPOOL_BUSY_TIMEOUT, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created TEXT, username TEXT, action TEXT)"
+        )
+        self.refresh()
+
+    def refresh(self):
+        try:
+            self.size = self.db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        except sqlite3.OperationalError:
+            pass  # база занята другим процессом — остаётся прежняя оценка размера
+
+    def __len__(self):
+        if self.shared:
+            self.refresh()
+        return self.size
+
+    def put(self, row) -> bool:
+        """Добавляет строку; при переполнении применяет политику, False — строка отброшена"""
+        if self.size >= self.max_rows and self.shared:
+            # Часть строк могли уже отправить и удалить другие процессы
+            self.refresh()
+        if self.size >= self.max_rows:
+            if self.policy == "drop_newest" or (
+                self.policy == "sample" and random.random() >= self.sample_rate
+            ):
+                self.dropped += 1
+                return False
+            # drop_oldest и попавшие в выборку при sample вытесняют самую старую запись
+            self.db.execute("DELETE FROM spool WHERE id = (SELECT MIN(id) FROM spool)")
+            self.size -= 1
+            self.dropped += 1
+
+        self.db.execute("INSERT INTO spool (created, username, action) VALUES (?, ?, ?)", row)
+        self.size += 1
+        return True
+
+    def peek(self, limit: int):
+        """Самые старые строки: (id последней строки, [строки])"""
+        rows = self.db.execute(
+            "SELECT id, created, username, action FROM spool ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+        if not rows:
+            return None, []
+        return rows[-1][0], [list(r[1:]) for r in rows]
+
+    def ack(self, last_id: int):
+        """Удаляет отправленные строки"""
+        self.size -= self.db.execute("DELETE FROM spool WHERE id <= ?", (last_id,)).rowcount
+
+log_spool = None
+log_flush_lock = asyncio.Lock()  # в Sheets одновременно уходит не больше одного батча
+log_wakeup = asyncio.Event()
+
+def get_log_spool() -> LogSpool:
+    global log_spool
+    if log_spool is None:
+        log_spool = LogSpool(LOG_SPOOL_PATH, LOG_SPOOL_MAX_ROWS, LOG_OVERFLOW_POLICY, LOG_SAMPLE_RATE,
+                             shared=WORKERS > 1)
+    return log_spool
 
 def add_to_buffer(username: str, action: str):
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_buffer.append([now, username, action])
-    print(f"Buffered log: {username} - {action}")
-    
-    # Если буфер достиг максимального размера, отправляем сразу
-    if len(log_buffer) >= MAX_BUFFER_SIZE:
-        asyncio.create_task(flush_logs())
-
-async def flush_logs():
-    global log_buffer
-    if not log_buffer:
-        return
-
-    # Создаем копию буфера и очищаем оригинал
-    rows_to_write = log_buffer.copy()
-    log_buffer.clear()
-
-    loop = asyncio.get_event_loop()
     try:
+        spool = get_log_spool()
+        dropped = spool.dropped
+        if spool.put([now, username, action]):
+            print(f"Buffered log: {username} - {action}")
+        metrics.log_rows_dropped.inc(spool.dropped - dropped)
+    except sqlite3.Error as e:
+        # Лог не должен ронять хендлер: строка теряется, как при переполнении спула
+        metrics.log_rows_dropped.inc()
+        print(f"❌ Строка лога отброшена: {e}")
+        return
+    metrics.log_spool_depth.set(spool.size)
+
+    # Набрался батч — будим log_worker, не дожидаясь LOG_INTERVAL
+    if spool.size >= MAX_BUFFER_SIZE:
+        log_wakeup.set()
+
+# --- Клиент Google Sheets ---
+# Авторизованный клиент и лист создаются один раз и переиспользуются. Вся работа
+# с gspread идёт в отдельном однопоточном пуле, чтобы не занимать event loop и
+# общий пул потоков. Токен доступа google-auth обновляет сам при истечении.
+sheets_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gsheets")
+sheets_worksheet = None
+
+def is_sheets_auth_error(e: Exception) -> bool:
+    import gspread
+    from google.auth.exceptions import RefreshError
+    if isinstance(e, RefreshError):
+        return True
+    if isinstance(e, gspread.exceptions.APIError):
+        return e.response is not None and e.response.status_code in (401, 403)
+    return False
+
+def get_worksheet():
+    """Возвращает лист логов, при необходимости авторизуясь заново (в sheets_executor)"""
+    global sheets_worksheet
+    if sheets_worksheet is None:
         client = init_google_sheets()
         if not client:
-            print("Google Sheets client not initialized")
-            # Возвращаем данные в буфер если не удалось инициализировать клиент
-            log_buffer.extend(rows_to_write)
+            return None
+        sheets_worksheet = client.open_by_key(GOOGLE_SHEET_KEY).worksheet(GOOGLE_SHEET_TAB_NAME)
+    return sheets_worksheet
+
+def append_log_rows(rows):
+    """Дописывает строки в лист; при ошибке авторизации переподключается один раз"""
+    global sheets_worksheet
+    for attempt in range(2):
+        sheet = get_worksheet()
+        if sheet is None:
+            raise RuntimeError("Google Sheets client not initialized")
+        try:
+            sheet.append_rows(rows)
             return
-
-        sheet = await loop.run_in_executor(
-            None,
-            lambda: client.open_by_key(GOOGLE_SHEET_KEY).worksheet(GOOGLE_SHEET_TAB_NAME)
-        )
-
-        # Массовая запись данных
-        await loop.run_in_executor(
-            None,
-            lambda: sheet.append_rows(rows_to_write)
-        )
-        
+        except Exception as e:
+            # Клиент сбрасываем при любой ошибке, чтобы следующая попытка начинала с чистого соединения
+            sheets_worksheet = None
+            if attempt or not is_sheets_auth_error(e):
+                raise
+            print(f"Google Sheets auth error, reconnecting: {e}")
+
+async def flush_logs() -> bool:
+    """Отправляет в Google Sheets один батч из спула; False — отправить не удалось"""
+    async with log_flush_lock:
+        spool = get_log_spool()
+        try:
+            last_id, rows_to_write = spool.peek(LOG_BATCH_SIZE)
+        except sqlite3.Error as e:
+            print(f"❌ Error reading log spool: {e}")
+            return False
+        if not rows_to_write:
+            return True
+
+        loop = asyncio.get_running_loop()
+        try:
+            # Массовая запись данных
+            await loop.run_in_executor(sheets_executor, append_log_rows, rows_to_write)
+        except Exception as e:
+            # Строки остаются в спуле до следующей попытки
+            metrics.log_flush_failures.inc()
+            print(f"❌ Error flushing logs: {e}")
+            return False
+
+        try:
+            spool.ack(last_id)
+        except sqlite3.Error as e:
+            # Строки уже в Sheets, но остались в спуле — при следующей отправке уйдут повторно
+            print(f"❌ Error acknowledging flushed logs: {e}")
+            return False
+        metrics.log_rows_flushed.inc(len(rows_to_write))
+        metrics.log_spool_depth.set(len(spool))
         print(f"✅ Flushed {len(rows_to_write)} logs to Google Sheets")
-
-    except Exception as e:
-        # При ошибке возвращаем данные обратно в буфер
-        log_buffer.extend(rows_to_write)
-        print(f"❌ Error flushing logs: {e}")
+        return True
 
 async def log_worker():
+    """Единственный писатель: отправляет спул по размеру или по времени, с экспоненциальной паузой после ошибок"""
+    failures = 0
     while True:
-        await asyncio.sleep(LOG_INTERVAL)
-        await flush_logs()
+        if failures:
+            delay = min(LOG_BACKOFF_MAX, LOG_BACKOFF_BASE * 2 ** (failures - 1))
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        else:
+            # Строки других процессов этот не разбудят — размер спула проверяем сами
+            deadline = time.monotonic() + LOG_INTERVAL
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(
+                        log_wakeup.wait(), timeout=min(LOG_POLL_INTERVAL, deadline - time.monotonic())
+                    )
+                    break
+                except asyncio.TimeoutError:
+                    if len(get_log_spool()) >= MAX_BUFFER_SIZE:
+                        break
+        log_wakeup.clear()
+
+        while len(get_log_spool()):
+            if not await flush_logs():
+                failures += 1
+                break
+            failures = 0
 
 # --- Главное меню ---
 main_menu = ReplyKeyboardMarkup(
@@ -191,65 +490,463 @@ class SearchFlow(StatesGroup):
 
 # --- Кэш CSV ---
 component_cache = None
+search_index = None  # SearchIndex по текущему component_cache
+catalog_history = OrderedDict()  # версия каталога (хэш CSV) -> SearchIndex, несколько последних
+CATALOG_HISTORY_SIZE = 3
+component_csv_hash = None
+component_etag = None
+component_last_modified = None
 last_fetch_time = 0
+last_attempt_time = 0
+catalog_refresh_task = None
 CACHE_TTL = 5 * 60  # 5 минут
+CACHE_RETRY_INTERVAL = 30  # пауза перед повторной попыткой после ошибки загрузки
+CSV_CHUNK_SIZE = 64 * 1024  # CSV каталога читается и разбирается такими кусками
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "catalog_snapshot.pickle")
+CATALOG_SNAPSHOT_VERSION = 3
+# Обновление каталога патчит текущий индекс, а не строит его заново. Полная
+# перестройка — если изменилась большая часть строк или в индексе накопилось
+# много удалённых и дописанных в конец записей
+CATALOG_DIFF_MAX_RATIO = 0.25
+CATALOG_COMPACT_RATIO = 0.2
+CATALOG_CHANGES_SIZE = 20
+catalog_changes = deque(maxlen=CATALOG_CHANGES_SIZE)  # что менялось при последних обновлениях
+
+def component_type(file_name: str) -> str:
+    """Определяет тип компонента по названию файла Figma"""
+    if file_name == "App Components":
+        return "mobile"
+    if file_name in ("Icons", "Placeholders"):
+        return "icon"
+    return "web"
+
+def record_type(r) -> str:
+    return component_type(r["File"].strip())
+
+def build_search_index(records):
+    """Строит поисковый индекс по записям каталога"""
+    return SearchIndex(records, record_type)
+
+def update_search_index(index, rows):
+    """
+    Новый индекс по строкам CSV и разница с текущим; выполняется в пуле потоков.
+    Текущий индекс не меняется: поиски, начатые по нему, видят прежний каталог.
+    """
+    if index is None:
+        return build_search_index(rows), None
+    diff = diff_catalog(index.live_records(), rows)
+    if len(diff) > CATALOG_DIFF_MAX_RATIO * len(rows):
+        return build_search_index(rows), diff
+    updated = index.updated(diff.removed_records(), diff.added_records(), record_type)
+    if updated.fragmentation > CATALOG_COMPACT_RATIO:
+        updated = build_search_index(updated.live_records())
+    return updated, diff
+
+def record_catalog_changes(diff, csv_hash: str):
+    """Запоминает, что изменилось в каталоге, и чистит file_id ушедших версий строк"""
+    summary = {"version": csv_hash, "time": datetime.now().isoformat(timespec="seconds"), **diff.summary()}
+    catalog_changes.append(summary)
+    for kind in ("added", "changed", "removed"):
+        metrics.catalog_row_changes.labels(kind).inc(summary[kind])
+    print(f"Изменения каталога: +{summary['added']} ~{summary['changed']} -{summary['removed']}")
+
+    for r in diff.removed_records():
+        if component_image_url(r):
+            file_id_cache.discard(image_cache_key(r))
+
+def publish_catalog(index, csv_hash: str):
+    """
+    Делает index текущим каталогом. Предыдущие версии ещё какое-то время
+    хранятся в catalog_history, чтобы начатые сессии поиска листались по тому
+    же снимку, по которому искали.
+    """
+    global component_cache, search_index, component_csv_hash
+    component_cache, search_index, component_csv_hash = index.live_records(), index, csv_hash
+    catalog_history[csv_hash] = index
+    catalog_history.move_to_end(csv_hash)
+    while len(catalog_history) > CATALOG_HISTORY_SIZE:
+        catalog_history.popitem(last=False)
+    drop_stale_search_results()
+    schedule_search_prewarm()
+
+
+def save_catalog_snapshot(snapshot: dict):
+    """Атомарно записывает каталог и индекс на диск; выполняется в пуле потоков"""
+    tmp_path = f"{CATALOG_SNAPSHOT_PATH}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, CATALOG_SNAPSHOT_PATH)
+
+def read_catalog_snapshot():
+    try:
+        with open(CATALOG_SNAPSHOT_PATH, "rb") as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    if snapshot.get("version") != CATALOG_SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+async def load_catalog_snapshot(replace: bool = False):
+    """
+    Поднимает каталог со снапшота при старте, чтобы поиск работал сразу,
+    ещё до первой загрузки CSV по сети. replace — заменить уже загруженный
+    каталог (так процессы-последователи подхватывают обновления лидера).
+    """
+    global component_etag, component_last_modified
+
+    loop = asyncio.get_running_loop()
+    try:
+        snapshot = await loop.run_in_executor(None, read_catalog_snapshot)
+    except Exception as e:
+        print("Ошибка чтения снапшота каталога:", e)
+        return
+    if not snapshot or (component_cache is not None and not replace):
+        return
+    if snapshot["csv_hash"] == component_csv_hash:
+        return
 
-async def get_component_data():
-    global component_cache, last_fetch_time
-    now = time.time()
-
-    if component_cache and now - last_fetch_time < CACHE_TTL:
-        return component_cache
-
+    publish_catalog(snapshot["index"], snapshot["csv_hash"])
+    catalog_changes.clear()
+    catalog_changes.extend(snapshot["changes"])
+    component_etag = snapshot["etag"]
+    component_last_modified = snapshot["last_modified"]
+    # last_fetch_time не трогаем: каталог считается устаревшим и перепроверяется условным запросом
+    print(f"Каталог загружен из снапшота: {len(component_cache)} компонентов")
+
+async def refresh_component_data():
+    """
+    Загружает CSV условным запросом (If-None-Match / If-Modified-Since).
+    На 304 и на неизменившееся содержимое только продлевает кэш, без разбора.
+    """
+    global component_etag, component_last_modified, last_fetch_time, last_attempt_time
+
+    last_attempt_time = time.time()
+    headers = {}
+    if component_cache is not None:
+        if component_etag:
+            headers["If-None-Match"] = component_etag
+        if component_last_modified:
+            headers["If-Modified-Since"] = component_last_modified
+
+    fetch_started = time.perf_counter()
+    fetch_status = "error"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(CSV_URL) as resp:
+        try:
+            async with get_http_session().get(CSV_URL, headers=headers) as resp:
+                fetch_status = str(resp.status)
+                if resp.status == 304:
+                    metrics.catalog_loads.labels("not_modified").inc()
+                    last_fetch_time = time.time()
+                    return
                 if resp.status != 200:
                     raise Exception(f"HTTP error: {resp.status}")
-                csv_text = await resp.text()
-                reader = csv.DictReader(io.StringIO(csv_text))
-                component_cache = list(reader)
-                last_fetch_time = now
-                print("CSV обновлен")
-                return component_cache
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+
+                # CSV разбирается по мере загрузки, целиком текст в памяти не держим
+                parser = CatalogParser()
+                digest = hashlib.sha1()
+                parse_time = 0.0
+                async for chunk in resp.content.iter_chunked(CSV_CHUNK_SIZE):
+                    digest.update(chunk)
+                    started = time.perf_counter()
+                    parser.feed(chunk)
+                    parse_time += time.perf_counter() - started
+                rows = parser.close()
+        finally:
+            metrics.csv_fetch_latency.labels(fetch_status).observe(time.perf_counter() - fetch_started)
+
+        loop = asyncio.get_running_loop()
+        csv_hash = digest.hexdigest()
+        changed = (etag, last_modified) != (component_etag, component_last_modified)
+        if component_cache is None or csv_hash != component_csv_hash:
+            started = time.perf_counter()
+            index, diff = await loop.run_in_executor(None, update_search_index, search_index, rows)
+            metrics.csv_parse_latency.observe(parse_time + time.perf_counter() - started)
+            publish_catalog(index, csv_hash)
+            if diff is not None:
+                record_catalog_changes(diff, csv_hash)
+            changed = True
+            print("CSV обновлен")
+
+        component_etag, component_last_modified = etag, last_modified
+        last_fetch_time = time.time()
+        if not changed:
+            return
+
+        snapshot = {
+            "version": CATALOG_SNAPSHOT_VERSION,
+            "index": search_index,
+            "csv_hash": component_csv_hash,
+            "etag": component_etag,
+            "last_modified": component_last_modified,
+            "changes": list(catalog_changes),
+        }
+        try:
+            await loop.run_in_executor(None, save_catalog_snapshot, snapshot)
+        except Exception as e:
+            print("Ошибка записи снапшота каталога:", e)
     except Exception as e:
+        # Предыдущий component_cache остаётся в силе
+        metrics.catalog_loads.labels("failed").inc()
         print("Ошибка загрузки CSV:", e)
-        return component_cache or []
 
-async def search_components(query, type_):
-    records = await get_component_data()
-    if not records:
-        return []
+def schedule_component_refresh():
+    """
+    Single-flight: пока загрузка CSV идёт, все вызывающие получают одну и ту же
+    задачу вместо того, чтобы запускать свою.
+    """
+    global catalog_refresh_task
+    if catalog_refresh_task is None or catalog_refresh_task.done():
+        metrics.catalog_loads.labels("started").inc()
+        catalog_refresh_task = asyncio.create_task(refresh_component_data())
+    else:
+        metrics.catalog_loads.labels("coalesced").inc()
+    return catalog_refresh_task
 
-    query = ' '.join((query or "").lower().strip().split())
-    filtered = []
+async def get_component_data():
+    """
+    Возвращает каталог из кэша. Устаревший кэш отдаётся сразу, а обновление
+    идёт в фоне (stale-while-revalidate). Ждать загрузку приходится только
+    когда кэша ещё нет совсем.
+    """
+    now = time.time()
 
-    for r in records:
-        tags = [tag.strip() for tag in (r.get("Tags", "") or "").lower().split(",")]
+    if component_cache is None:
+        metrics.catalog_requests.labels("miss").inc()
+        # shield: отмена одного ожидающего хендлера не должна отменять общую загрузку
+        await asyncio.shield(schedule_component_refresh())
+    elif now - last_fetch_time < CACHE_TTL:
+        metrics.catalog_requests.labels("hit").inc()
+    else:
+        metrics.catalog_requests.labels("stale").inc()
+        # Устаревший каталог обновляет только лидер, остальные подхватывают его снапшот
+        if is_leader and now - last_attempt_time >= CACHE_RETRY_INTERVAL:
+            schedule_component_refresh()
 
-        if query in tags:
-            file_name = r["File"].strip()
-            if type_ == "mobile" and file_name == "App Components":
-                filtered.append(r)
-            elif type_ == "icon" and file_name in ("Icons", "Placeholders"):
-                filtered.append(r)
-            elif type_ == "web" and file_name not in ("App Components", "Icons", "Placeholders"):
-                filtered.append(r)
+    return component_cache or []
 
-    filtered.sort(key=lambda x: x["Component"].lower())
-    return filtered
+async def catalog_refresher():
+    """Фоновое обновление каталога, чтобы загрузка не попадала на запросы пользователей"""
+    while True:
+        # После неудачной попытки (в том числе стартовой) — пауза CACHE_RETRY_INTERVAL
+        if last_fetch_time >= last_attempt_time:
+            next_refresh = last_fetch_time + CACHE_TTL
+        else:
+            next_refresh = last_attempt_time + CACHE_RETRY_INTERVAL
+        if time.time() >= next_refresh:
+            await asyncio.shield(schedule_component_refresh())
+            continue
+        await asyncio.sleep(max(1, next_refresh - time.time()))
+
+# --- Лидер среди процессов ---
+# Фоновую работу (загрузку CSV, отправку логов, запись кэшей) делает один
+# процесс — тот, кто держит flock на LEADER_LOCK_PATH. Остальные подхватывают
+# каталог из снапшота, который пишет лидер, и ждут, не освободится ли блокировка.
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", "bot.leader.lock")
+LEADER_POLL_INTERVAL = 5
+
+is_leader = WORKERS == 1
+leader_lock_file = None
+
+def try_become_leader() -> bool:
+    global is_leader, leader_lock_file
+    if is_leader:
+        return True
+    lock_file = open(LEADER_LOCK_PATH, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    # Блокировка живёт, пока открыт файл, — то есть до конца процесса
+    leader_lock_file = lock_file
+    is_leader = True
+    return True
 
-async def send_large_message(chat_id: int, text: str, delay: float = 0.5):
-    max_length = 4000
-    parts = [text[i:i+max_length] for i in range(0, len(text), max_length)]
-    
+async def follower_loop():
+    snapshot_mtime = None
+    while not try_become_leader():
+        try:
+            mtime = os.stat(CATALOG_SNAPSHOT_PATH).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != snapshot_mtime:
+            snapshot_mtime = mtime
+            await load_catalog_snapshot(replace=True)
+        await asyncio.sleep(LEADER_POLL_INTERVAL)
+
+    print(f"Процесс {os.getpid()} стал лидером")
+    start_leader_tasks()
+
+def start_leader_tasks():
+    # Запускаем фоновую задачу для периодической отправки логов
+    asyncio.create_task(log_worker())
+    print("Log worker started")
+
+    asyncio.create_task(file_id_cache_saver())
+
+    # Каталог дальше обновляется в фоне
+    asyncio.create_task(catalog_refresher())
+    print("Catalog refresher started")
+
+    asyncio.create_task(fsm_storage_purger())
+
+# --- Кэш результатов поиска ---
+# (версия каталога, нормализованный запрос, тип) -> id найденных записей.
+# Версия в ключе: после обновления каталога старые результаты не находятся,
+# а когда версия уходит из catalog_history — удаляются
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 2000))  # запросов
+SEARCH_CACHE_MAX_IDS = int(os.getenv("SEARCH_CACHE_MAX_IDS", 500_000))  # id во всех результатах вместе
+SEARCH_PREWARM_TOP = int(os.getenv("SEARCH_PREWARM_TOP", 50))  # популярных запросов прогреваем после обновления
+QUERY_STATS_SIZE = 5000  # сколько разных запросов помним для прогрева
+
+search_cache = OrderedDict()
+search_cache_ids = 0
+search_cache_stats = {"hits": 0, "misses": 0, "prewarmed": 0}
+popular_queries = Counter()  # (запрос, тип) -> сколько раз искали
+search_prewarm_task = None
+
+def log_search_query(username: str, action: str, query: str, type_):
+    """Пишет запрос в лог и учитывает его для прогрева кэша"""
+    add_to_buffer(username, action)
+    popular_queries[(normalize(query), type_)] += 1
+    if len(popular_queries) > QUERY_STATS_SIZE:
+        # Редкие запросы забываем, частые остаются
+        kept = popular_queries.most_common(QUERY_STATS_SIZE // 2)
+        popular_queries.clear()
+        popular_queries.update(dict(kept))
+
+def cached_search(version: str, index, query: str, type_, prewarm: bool = False):
+    global search_cache_ids
+    key = (version, normalize(query), type_)
+    ids = search_cache.get(key)
+    if ids is not None:
+        search_cache.move_to_end(key)
+        if not prewarm:
+            search_cache_stats["hits"] += 1
+            metrics.search_cache_requests.labels("hit").inc()
+        return ids
+
+    result = "prewarm" if prewarm else "miss"
+    search_cache_stats["prewarmed" if prewarm else "misses"] += 1
+    metrics.search_cache_requests.labels(result).inc()
+    ids = search_cache[key] = timed_search(index, query, type_)
+    search_cache_ids += len(ids)
+    while len(search_cache) > SEARCH_CACHE_SIZE or search_cache_ids > SEARCH_CACHE_MAX_IDS:
+        search_cache_ids -= len(search_cache.popitem(last=False)[1])
+    return ids
+
+def drop_stale_search_results():
+    """Удаляет результаты по версиям каталога, которых уже нет в catalog_history"""
+    global search_cache_ids
+    for key in [key for key in search_cache if key[0] not in catalog_history]:
+        search_cache_ids -= len(search_cache.pop(key))
+
+def schedule_search_prewarm():
+    global search_prewarm_task
+    if search_prewarm_task is None or search_prewarm_task.done():
+        try:
+            search_prewarm_task = asyncio.get_running_loop().create_task(prewarm_search_cache())
+        except RuntimeError:
+            pass  # каталог опубликован вне event loop — прогреется при следующем обновлении
+
+async def prewarm_search_cache():
+    """Заранее ищет популярные запросы по новой версии каталога"""
+    version, index = component_csv_hash, search_index
+    for query, type_ in [key for key, _ in popular_queries.most_common(SEARCH_PREWARM_TOP)]:
+        if component_csv_hash != version:
+            return  # каталог успел обновиться ещё раз
+        cached_search(version, index, query, type_, prewarm=True)
+        await asyncio.sleep(0)  # не держим event loop на всём списке
+
+async def search_component_ids(query, type_):
+    """Возвращает версию каталога и id найденных в ней записей"""
+    records = await get_component_data()
+    if not records:
+        return None, []
+    return component_csv_hash, cached_search(component_csv_hash, search_index, query, type_)
+
+def timed_search(index, query, type_):
+    with metrics.search_latency.time():
+        return index.search(query, type_)
+
+def get_catalog(version: str):
+    """Индекс нужной версии каталога; если она уже вытеснена — текущий"""
+    return catalog_history.get(version) or search_index
+
+async def search_components(query, type_):
+    version, ids = await search_component_ids(query, type_)
+    index = get_catalog(version)
+    return [index.records[i] for i in ids]
+
+def get_results_page(version: str, query: str, type_: str, offset: int, limit: int):
+    """
+    Страница результатов поиска: (всего найдено, записи страницы). Поиск
+    повторяется по тому же снимку каталога — в состоянии сессии хранятся только
+    запрос и смещение, а не сами результаты.
+    """
+    index = get_catalog(version)
+    if index is None:
+        return 0, []
+    if version not in catalog_history:
+        version = component_csv_hash
+    ids = cached_search(version, index, query, type_)
+    return len(ids), [index.records[i] for i in ids[offset:offset + limit]]
+
+# --- Отправка в Telegram ---
+# Лимиты Bot API: около 30 сообщений в секунду на бота и около одного в секунду
+# на чат (короткие всплески допускаются)
+TELEGRAM_GLOBAL_RATE = 30 / WORKERS  # лимит бота делят все процессы
+TELEGRAM_CHAT_RATE = 1
+TELEGRAM_CHAT_BURST = 20
+TELEGRAM_MAX_RETRIES = 3
+
+class SendScheduler:
+    """
+    Планировщик исходящих запросов к Bot API: перед запросом резервирует
+    токены в глобальном ведре и в ведре чата и ждёт, если их нет. На 429
+    выжидает retry_after и повторяет запрос.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, max_retries: int):
+        self.global_limiter = RateLimiter(global_rate, global_rate)
+        self.chat_limiter = RateLimiter(chat_rate, chat_burst)
+        self.max_retries = max_retries
+
+    async def call(self, chat_id: int, make_request, cost: int = 1):
+        """make_request — функция без аргументов, возвращающая корутину запроса"""
+        for attempt in range(self.max_retries + 1):
+            delay = max(self.global_limiter.reserve(None, cost), self.chat_limiter.reserve(chat_id, cost))
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                return await make_request()
+            except TelegramRetryAfter as e:
+                # 429 считает metrics.TelegramMetricsMiddleware (bot_telegram_retry_after_total)
+                if attempt == self.max_retries:
+                    raise
+                print(f"Telegram 429 для чата {chat_id}, ждём {e.retry_after} с")
+                await asyncio.sleep(e.retry_after)
+
+send_scheduler = SendScheduler(TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_MAX_RETRIES)
+
+async def send_parts(chat_id: int, parts):
+    """Отправляет текст, заранее разрезанный split_message"""
+    # Паузы между частями выдерживает планировщик
     for part in parts:
-        await bot.send_message(chat_id, part)
-        if len(parts) > 1:
-            await asyncio.sleep(delay)
+        await send_scheduler.call(chat_id, lambda part=part: bot.send_message(chat_id, part))
+
+# --- Кнопки меню ---
+# Кнопки поиска срабатывают в любом состоянии и начинают поиск заново.
+# Остальные проверяются после хендлеров состояний поиска: пока идёт поиск,
+# их текст считается запросом
+search_commands = TextCommands()
+menu_commands = TextCommands()
 
 # --- Обработчик для кнопки "Иконка или заглушка" ---
-@dp.message(lambda msg: msg.text and msg.text.lower() == "иконка или заглушка")
+@search_commands.command("Иконка или заглушка", "Icon or placeholder")
 async def icon_search_direct(message: types.Message, state: FSMContext):
     username = message.from_user.username or str(message.from_user.id)
     add_to_buffer(username, "Прямой поиск иконок/заглушек")
@@ -278,7 +975,7 @@ async def start_cmd(message: types.Message):
         parse_mode="HTML"
     )
 
-@dp.message(lambda msg: msg.text and msg.text.lower() == "найти компонент")
+@search_commands.command("Найти компонент", "Find component")
 async def search_start(message: types.Message, state: FSMContext):
     add_to_buffer(message.from_user.username or str(message.from_user.id), "Начат поиск компонентов")
     kb = ReplyKeyboardMarkup(
@@ -291,6 +988,8 @@ async def search_start(message: types.Message, state: FSMContext):
     await message.answer("Выберите тип компонента:", reply_markup=kb)
     await state.set_state(SearchFlow.choose_type)
 
+search_commands.register(dp.message)
+
 @dp.message(SearchFlow.choose_type)
 async def type_chosen(message: types.Message, state: FSMContext):
     username = message.from_user.username or str(message.from_user.id)
@@ -334,11 +1033,11 @@ async def query_input(message: types.Message, state: FSMContext):
 
     data = await state.get_data()
     query = message.text
-    add_to_buffer(username, f"Поисковой запрос: {query} (тип: {data['type']})")
+    log_search_query(username, f"Поисковой запрос: {query} (тип: {data['type']})", query, data["type"])
     
-    results = await search_components(query, data["type"])
+    version, ids = await search_component_ids(query, data["type"])
     
-    if not results:
+    if not ids:
         await message.answer(
             f'Компоненты по запросу "{query}" не найдены.',
             reply_markup=ReplyKeyboardMarkup(
@@ -349,41 +1048,180 @@ async def query_input(message: types.Message, state: FSMContext):
         return
     
     await state.update_data(
-        all_results=results,
+        catalog_version=version,
         shown=0,
         query=query
     )
     await show_results_batch(message, state)
 
-async def show_results_batch(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    results = data["all_results"]
-    shown = data["shown"]
-    batch_size = 10
-    
-    batch = results[shown:shown+batch_size]
+# --- Кэш file_id картинок ---
+# Telegram отдаёт file_id загруженного фото; повторная отправка по file_id не
+# заставляет его заново скачивать и обрабатывать картинку из Figma
+FILE_ID_CACHE_PATH = os.getenv("FILE_ID_CACHE_PATH", "file_id_cache.json")
+FILE_ID_CACHE_SIZE = int(os.getenv("FILE_ID_CACHE_SIZE", 20000))
+FILE_ID_SAVE_INTERVAL = 60  # секунд
+
+class FileIdCache:
+    """LRU-кэш «картинка -> file_id» с сохранением в JSON-файл"""
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: str):
+        file_id = self.entries.get(key)
+        if file_id is None:
+            metrics.file_id_cache_requests.labels("miss").inc()
+            return None
+        self.entries.move_to_end(key)
+        metrics.file_id_cache_requests.labels("hit").inc()
+        return file_id
+
+    def put(self, key: str, file_id: str):
+        self.entries[key] = file_id
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    def discard(self, key: str):
+        if self.entries.pop(key, None) is not None:
+            self.dirty = True
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = OrderedDict(json.load(f)[-self.max_size:])
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print("Ошибка чтения кэша file_id:", e)
 
-    await message.answer(
-        f"Найдено: {len(results)}. Показано {shown+1} из {min(shown+len(batch), len(results))}:"
-    )
+    def save(self):
+        """Пишет кэш на диск, если он менялся; запись атомарная"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        entries = list(self.entries.items())
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+file_id_cache = FileIdCache(FILE_ID_CACHE_PATH, FILE_ID_CACHE_SIZE)
+
+async def file_id_cache_saver():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(FILE_ID_SAVE_INTERVAL)
+        try:
+            await loop.run_in_executor(None, file_id_cache.save)
+        except Exception as e:
+            print("Ошибка записи кэша file_id:", e)
+
+def component_image_url(r) -> str:
+    return r.get("Image", "").replace('=IMAGE("', "").replace('")', "").strip()
+
+def component_version(r) -> str:
+    """Версия содержимого записи: меняется при любой правке строки в CSV"""
+    return hashlib.sha1("\x1f".join(map(str, r.values())).encode("utf-8")).hexdigest()[:12]
+
+def image_cache_key(r) -> str:
+    return f"{component_image_url(r)}#{component_version(r)}"
+
+def remember_file_id(key: str, sent: types.Message):
+    if sent and sent.photo:
+        file_id_cache.put(key, sent.photo[-1].file_id)
+
+async def send_component_photo(chat_id: int, key: str, image_url: str, text: str):
+    """
+    Фото с подписью: сначала по закэшированному file_id, затем по URL. Если
+    Telegram не смог забрать картинку — просто текст. 429, оставшийся после
+    повторов планировщика, пробрасывается: слать в этот чат дальше бессмысленно.
+    """
+    file_id = file_id_cache.get(key)
+    if file_id:
+        try:
+            await send_scheduler.call(chat_id, lambda: bot.send_photo(chat_id, photo=file_id, caption=text))
+            return
+        except TelegramRetryAfter:
+            raise
+        except Exception as e:
+            print("Ошибка отправки фото по file_id:", e)
+            file_id_cache.discard(key)
 
+    try:
+        sent = await send_scheduler.call(chat_id, lambda: bot.send_photo(chat_id, photo=image_url, caption=text))
+        remember_file_id(key, sent)
+    except TelegramRetryAfter:
+        raise
+    except Exception as e:
+        print("Ошибка отправки фото:", e)
+        await send_scheduler.call(chat_id, lambda: bot.send_message(chat_id, text))
+
+async def send_results(chat_id: int, batch):
+    """
+    Отправляет страницу результатов: компоненты с картинками — одним альбомом
+    (sendMediaGroup), без картинок — одним текстовым сообщением
+    """
+    photos, texts = [], []
     for r in batch:
         text = f"<a href='{r['Link']}'>{r['Component']}</a> из {r['File']}"
-        image_url = r.get("Image", "").replace('=IMAGE("', "").replace('")', "").strip()
+        image_url = component_image_url(r)
         if image_url:
-            try:
-                await bot.send_photo(message.chat.id, photo=image_url, caption=text)
-            except Exception as e:
-                print("Ошибка отправки фото:", e)
-                await message.answer(text)
+            photos.append((image_cache_key(r), image_url, text))
         else:
-            await message.answer(text)
-    
+            texts.append(text)
+
+    if len(photos) == 1:
+        await send_component_photo(chat_id, *photos[0])
+    elif photos:
+        media = [
+            InputMediaPhoto(media=file_id_cache.get(key) or url, caption=text)
+            for key, url, text in photos
+        ]
+        try:
+            sent = await send_scheduler.call(
+                chat_id, lambda: bot.send_media_group(chat_id, media=media), cost=len(media)
+            )
+            for (key, _, _), message in zip(photos, sent):
+                remember_file_id(key, message)
+        except TelegramRetryAfter:
+            raise
+        except Exception as e:
+            # Одна недоступная картинка роняет весь альбом — шлём по одной,
+            # по порядку, чтобы страница осталась отсортированной
+            print("Ошибка отправки альбома:", e)
+            for photo in photos:
+                await send_component_photo(chat_id, *photo)
+
+    if texts:
+        await send_scheduler.call(chat_id, lambda: bot.send_message(chat_id, "\n".join(texts)))
+
+async def show_results_batch(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    shown = data["shown"]
+    batch_size = 10
+    chat_id = message.chat.id
+
+    total, batch = get_results_page(data["catalog_version"], data["query"], data["type"], shown, batch_size)
+
+    await send_scheduler.call(chat_id, lambda: message.answer(
+        f"Найдено: {total}. Показано {shown+1} из {min(shown+len(batch), total)}:"
+    ))
+
+    await send_results(chat_id, batch)
+
     new_shown = shown + len(batch)
     await state.update_data(shown=new_shown)
     
-    if new_shown < len(results):
-        await message.answer(
+    if new_shown < total:
+        await send_scheduler.call(chat_id, lambda: message.answer(
             "Показать еще?",
             reply_markup=ReplyKeyboardMarkup(
                 keyboard=[
@@ -391,16 +1229,16 @@ async def show_results_batch(message: types.Message, state: FSMContext):
                 ],
                 resize_keyboard=True
             )
-        )
+        ))
         await state.set_state(SearchFlow.show_more)
     else:
-        await message.answer(
+        await send_scheduler.call(chat_id, lambda: message.answer(
             "Все результаты показаны.\nВведите новый запрос или нажмите 'Отмена'",
             reply_markup=ReplyKeyboardMarkup(
                 keyboard=[[KeyboardButton(text="Отмена")]],
                 resize_keyboard=True
             )
-        )
+        ))
         await state.set_state(SearchFlow.input_query)
 
 @dp.message(SearchFlow.show_more)
@@ -421,11 +1259,91 @@ async def handle_show_more(message: types.Message, state: FSMContext):
         )
         await state.set_state(SearchFlow.input_query)
 
+# --- Инлайн-поиск (@bot запрос) ---
+INLINE_PAGE_SIZE = 20  # Telegram принимает до 50 результатов за ответ
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 300))  # секунд Telegram хранит ответ у себя
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", 1000))  # страниц в LRU на стороне бота
+
+# (версия каталога, запрос, смещение) -> (результаты, next_offset)
+inline_pages = OrderedDict()
+
+def inline_result(result_id: str, r):
+    text = f"<a href='{r['Link']}'>{r['Component']}</a> из {r['File']}"
+    image_url = component_image_url(r)
+    if image_url:
+        file_id = file_id_cache.get(image_cache_key(r))
+        if file_id:
+            return InlineQueryResultCachedPhoto(
+                id=result_id, photo_file_id=file_id, caption=text, parse_mode="HTML"
+            )
+        return InlineQueryResultPhoto(
+            id=result_id, photo_url=image_url, thumbnail_url=image_url,
+            title=r["Component"], description=r["File"], caption=text, parse_mode="HTML"
+        )
+    return InlineQueryResultArticle(
+        id=result_id, title=r["Component"], description=r["File"],
+        input_message_content=InputTextMessageContent(message_text=text, parse_mode="HTML")
+    )
+
+def get_inline_page(version: str, query: str, offset: int):
+    """
+    Страница инлайн-результатов из LRU. Повторный запрос — даже от другого
+    пользователя — не ищет заново и не собирает результаты.
+    """
+    key = (version, query, offset)
+    page = inline_pages.get(key)
+    if page is not None:
+        inline_pages.move_to_end(key)
+        metrics.inline_cache_requests.labels("hit").inc()
+        return page
+
+    metrics.inline_cache_requests.labels("miss").inc()
+    total, batch = get_results_page(version, query, None, offset, INLINE_PAGE_SIZE)
+    results = [inline_result(f"{offset + i}:{component_version(r)}", r) for i, r in enumerate(batch)]
+    # Версия каталога едет в смещении: следующие страницы берутся из того же снимка
+    next_offset = f"{version}:{offset + len(batch)}" if offset + len(batch) < total else ""
+
+    page = inline_pages[key] = (results, next_offset)
+    while len(inline_pages) > INLINE_CACHE_SIZE:
+        inline_pages.popitem(last=False)
+    return page
+
+@dp.inline_query()
+async def inline_search(inline_query: types.InlineQuery):
+    query = " ".join(inline_query.query.lower().split())
+    if not query:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME)
+        return
+
+    if inline_query.offset:
+        version, _, offset = inline_query.offset.rpartition(":")
+        offset = int(offset)
+    else:
+        # Сам поиск — в get_inline_page, и только если страницы нет в кэше
+        await get_component_data()
+        version, offset = component_csv_hash, 0
+
+    if version is None:
+        await inline_query.answer([], cache_time=0)
+        return
+
+    results, next_offset = get_inline_page(version, query, offset)
+    # Результаты одинаковы для всех, поэтому Telegram может отдавать их из своего кэша
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False, next_offset=next_offset)
+
+@dp.chosen_inline_result()
+async def inline_result_chosen(chosen: types.ChosenInlineResult):
+    """
+    Инлайн-запросы Telegram шлёт, пока пользователь печатает, поэтому в лог и
+    в статистику для прогрева попадает только запрос, результат которого
+    выбрали. Эти апдейты приходят, если в BotFather включён /setinlinefeedback.
+    """
+    query = " ".join(chosen.query.lower().split())
+    username = chosen.from_user.username or str(chosen.from_user.id)
+    log_search_query(username, f"Инлайн-запрос: {query}", query, None)
+
 # --- Изучить гайды ---
-@dp.message(lambda msg: msg.text and msg.text.lower() == "изучить гайды")
-async def guides(message: types.Message):
-    add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр гайдлайнов")
-    await send_large_message(message.chat.id, """
+GUIDES_PARTS = split_message("""
 Хранилище правил и рекомендаций дизайн-системы в Figma — <a href="https://www.figma.com/design/5ZYTwB6jw2wutqg60sc4Ff/Granat-Guides-WIP?node-id=181-20673">Granat Guides</a>
 
 Быстрые ссылки на материалы:
@@ -447,11 +1365,13 @@ async def guides(message: types.Message):
 <a href="https://www.figma.com/design/5ZYTwB6jw2wutqg60sc4Ff/Granat-Guides-WIP?node-id=659-70">🎨 Цветовое кодирование статусов</a>
 """)
 
+@menu_commands.command("Изучить гайды", "Гайды", "Guides")
+async def guides(message: types.Message):
+    add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр гайдлайнов")
+    await send_parts(message.chat.id, GUIDES_PARTS)
+
 # --- Предложить доработку ---
-@dp.message(lambda msg: msg.text and msg.text.lower() == "предложить доработку")
-async def suggest(message: types.Message):
-    add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр предложения доработки")
-    await send_large_message(message.chat.id, """
+SUGGEST_PARTS = split_message("""
 ➡️ Нашли баг в работе компонента Granat в Figma?
 Заведите запрос на доработку <a href="https://gitlab.services.mts.ru/digital-products/design-system/support/design/-/issues/new">в GitLab (доступно под корпоративным VPN).</a>
 
@@ -465,11 +1385,13 @@ async def suggest(message: types.Message):
 ⏳ Команда дизайн-системы реагирует на запрос в порядке очереди в течение 3 рабочих дней.
 """)
 
+@menu_commands.command("Предложить доработку", "Suggest improvement")
+async def suggest(message: types.Message):
+    add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр предложения доработки")
+    await send_parts(message.chat.id, SUGGEST_PARTS)
+
 # --- Добавить иконку или логотип ---
-@dp.message(lambda msg: msg.text and msg.text.lower() == "добавить иконку или логотип")
-async def add_icon(message: types.Message):
-    add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр добавления иконки или логотипа")
-    await send_large_message(message.chat.id, """
+ADD_ICON_PARTS = split_message("""
 ➡️ Интерфейсные иконки
 
 Недостающие интерфейсные иконки продукт создает своими силами или нанимает подрядчика. Созданные иконки проходят ревью и согласование у дизайн лида или арт-директора продукта.
@@ -491,8 +1413,13 @@ async def add_icon(message: types.Message):
 Чтобы добавить продуктовую иконку или логотип в ДС, создайте запрос <a href="https://gitlab.services.mts.ru/digital-products/design-system/support/design/-/issues/new">в GitLab (доступно под корпоративным VPN).</a>
 """)
 
+@menu_commands.command("Добавить иконку или логотип", "Add icon or logo")
+async def add_icon(message: types.Message):
+    add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр добавления иконки или логотипа")
+    await send_parts(message.chat.id, ADD_ICON_PARTS)
+
 # --- Посмотреть последние изменения ---
-@dp.message(lambda msg: msg.text and msg.text.lower() == "посмотреть последние изменения")
+@menu_commands.command("Посмотреть последние изменения", "Последние изменения", "Latest changes")
 async def changes(message: types.Message):
     add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр последних изменений")
     await message.answer(
@@ -503,10 +1430,7 @@ async def changes(message: types.Message):
     )
 
 # --- Поддержка ---
-@dp.message(lambda msg: msg.text and msg.text.lower() == "поддержка")
-async def support(message: types.Message):
-    add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр поддержки")
-    await send_large_message(message.chat.id, """
+SUPPORT_PARTS = split_message("""
 ➡️ Закрытая группа DS Community в Telegram
 
 Добавьтесь в коммьюнити дизайн-системы в Telegram. Здесь вы сможете получать всю самую свежую информацию, новости и обновления, задавать вопросы разработчикам и дизайнерам, а также общаться с коллегами, которые используют дизайн-систему.
@@ -519,12 +1443,14 @@ async def support(message: types.Message):
 ➡️ По вопросам обращайтесь на почту kuskova@mts.ru
 Кускова Юлия — Design Lead МТС GRANAT
 """)
+
+@menu_commands.command("Поддержка", "Support")
+async def support(message: types.Message):
+    add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр поддержки")
+    await send_parts(message.chat.id, SUPPORT_PARTS)
     
 # --- FAQ ---
-@dp.message(lambda msg: msg.text and msg.text.lower() == "faq")
-async def faq(message: types.Message):
-    add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр FAQ")
-    await send_large_message(message.chat.id, """
+FAQ_PARTS = split_message("""
 📘 Введение
 • <a href="https://www.figma.com/design/a7UeDnUeJGZPx6AGBYpXTa/DS-GRANAT-FAQ?node-id=33-146">Что такое DS GRANAT и зачем она нужна?</a>
 • <a href="https://www.figma.com/design/a7UeDnUeJGZPx6AGBYpXTa/DS-GRANAT-FAQ?node-id=29-134">Что такое базовая дизайн-система в рамках экосистемы?</a>
@@ -561,6 +1487,12 @@ async def faq(message: types.Message):
 • <a href="https://www.figma.com/design/a7UeDnUeJGZPx6AGBYpXTa/DS-GRANAT-FAQ?node-id=2042-1399">Кто проверяет на соответствие ДС?</a>
 """)
 
+@menu_commands.command("FAQ", "Частые вопросы")
+async def faq(message: types.Message):
+    add_to_buffer(message.from_user.username or str(message.from_user.id), "Просмотр FAQ")
+    await send_parts(message.chat.id, FAQ_PARTS)
+
+menu_commands.register(dp.message)
 
 # --- Тестовая команда для проверки логирования ---
 @dp.message(Command("test_log"))
@@ -569,18 +1501,249 @@ async def test_log(message: types.Message):
     add_to_buffer(username, "Test log entry")
     await message.answer("Запись добавлена в буфер логов")
 
-# --- Запуск воркера логирования при старте ---
+# --- Профилирование (команды администраторов) ---
+# Команды действуют на процесс, который получил апдейт; при WORKERS > 1 — на один из воркеров
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")  # без него /debug/profile в FastAPI выключен
+PROFILE_INTERVAL = 0.01  # секунд между снимками стека
+MIN_COMMAND_MS = 1  # чаще поток профилировщика и трассировка отнимают GIL у бота
+PROFILE_MAX_SECONDS = 60  # дольше HTTP-замер не длится
+SLOW_CALL_THRESHOLD_MS = float(os.getenv("SLOW_CALL_THRESHOLD_MS", 0))  # 0 — трассировка выключена
+
+profiler = SamplingProfiler()
+slow_calls = SlowCallTracer(
+    globals(), ("get_component_data", "flush_logs"),
+    [observer for event_type, observer in dp.observers.items() if event_type != "update"]
+)
+bot_thread_id = None  # поток event loop бота: его и снимает профилировщик
+
+async def is_admin(message: types.Message) -> bool:
+    return message.from_user is not None and message.from_user.id in ADMIN_IDS
+
+def parse_ms(command: CommandObject, default_ms: float) -> float:
+    """
+    Миллисекунды из аргумента команды, возвращаются в секундах. На нечисло и
+    значения меньше MIN_COMMAND_MS — ValueError с текстом для ответа админу.
+    """
+    arg = (command.args or "").strip().replace(",", ".")
+    if not arg:
+        return default_ms / 1000
+    try:
+        value = float(arg)
+    except ValueError:
+        raise ValueError(f"Аргумент — число миллисекунд, например /{command.command} {default_ms:g}") from None
+    if not MIN_COMMAND_MS <= value < float("inf"):  # заодно отсекает nan
+        raise ValueError(f"Нужно не меньше {MIN_COMMAND_MS} мс")
+    return value / 1000
+
+def parse_threshold_ms(command: CommandObject, default_ms: float):
+    """Порог из аргумента команды в секундах; None для «off»"""
+    if (command.args or "").strip().lower() == "off":
+        return None
+    return parse_ms(command, default_ms)
+
+@dp.message(Command("profile_start"), is_admin)
+async def profile_start(message: types.Message, command: CommandObject):
+    if profiler.running:
+        await message.answer("Профилировщик уже запущен, остановить — /profile_stop")
+        return
+    try:
+        interval = parse_ms(command, PROFILE_INTERVAL * 1000)
+    except ValueError as e:
+        await message.answer(str(e))
+        return
+    profiler.start(interval, bot_thread_id)
+    await message.answer(f"Профилировщик запущен, снимок стека каждые {interval * 1000:g} мс. Остановить — /profile_stop")
+
+@dp.message(Command("profile_stop"), is_admin)
+async def profile_stop(message: types.Message):
+    if not profiler.running:
+        await message.answer("Профилировщик не запущен")
+        return
+    elapsed = time.perf_counter() - profiler.started
+    collapsed = profiler.stop()
+    filename = f"profile-{datetime.now():%Y%m%d-%H%M%S}.collapsed"
+    await message.answer_document(
+        BufferedInputFile(collapsed.encode("utf-8"), filename=filename),
+        caption=f"{profiler.samples} снимков за {elapsed:.0f} с. Flame graph: flamegraph.pl или speedscope.app"
+    )
+
+@dp.message(Command("slow_callbacks"), is_admin)
+async def slow_callbacks(message: types.Message, command: CommandObject):
+    try:
+        threshold = parse_threshold_ms(command, 100)
+    except ValueError as e:
+        await message.answer(f"{e}, или off")
+        return
+    set_slow_callback_detection(asyncio.get_running_loop(), threshold)
+    if threshold is None:
+        await message.answer("Поиск медленных колбэков asyncio выключен")
+    else:
+        await message.answer(f"Колбэки event loop дольше {threshold * 1000:g} мс пишутся в лог. Выключить — /slow_callbacks off")
+
+@dp.message(Command("trace_slow"), is_admin)
+async def trace_slow(message: types.Message, command: CommandObject):
+    try:
+        threshold = parse_threshold_ms(command, SLOW_CALL_THRESHOLD_MS or 500)
+    except ValueError as e:
+        await message.answer(f"{e}, или off")
+        return
+    if threshold is None:
+        slow_calls.disable()
+        await message.answer("Трассировка медленных вызовов выключена")
+    else:
+        slow_calls.enable(threshold)
+        await message.answer(
+            f"Хендлеры, get_component_data и flush_logs дольше {threshold * 1000:g} мс пишутся в лог со стеком. "
+            "Выключить — /trace_slow off"
+        )
+
+# --- Старт и остановка процесса ---
+# Перед приёмом апдейтов процесс параллельно прогревает каталог и пулы
+# соединений. Render останавливает сервис SIGTERM-ом и через 30 секунд убивает
+# процесс: за SHUTDOWN_TIMEOUT бот перестаёт принимать апдейты, дожидается
+# начатых хендлеров и отправляет спул логов.
+STARTUP_WARMUP_TIMEOUT = float(os.getenv("STARTUP_WARMUP_TIMEOUT", 15))  # секунд на каждый шаг прогрева
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", 20))  # с запасом до SIGKILL
+
+startup_timer = StartupTimer()
+inflight_updates = InFlightUpdates()
+dp.update.outer_middleware(inflight_updates)
+shutdown_deadline = None  # time.monotonic(), к которому процесс должен остановиться
+stop_requested = asyncio.Event()
+
+def begin_shutdown():
+    """Засекает срок остановки; повторный сигнал его не продлевает"""
+    global shutdown_deadline
+    if shutdown_deadline is None:
+        shutdown_deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        print(f"Остановка: на завершение {SHUTDOWN_TIMEOUT:g} с")
+
+def shutdown_time_left() -> float:
+    begin_shutdown()
+    return max(0.0, shutdown_deadline - time.monotonic())
+
+def request_stop():
+    """Обработчик SIGTERM/SIGINT в режиме polling"""
+    begin_shutdown()
+    stop_requested.set()
+
+async def drain_updates():
+    """Ждёт апдейты, которые уже в обработке, пока FSM-хранилище ещё открыто"""
+    if update_tasks:
+        await asyncio.wait(update_tasks, timeout=shutdown_time_left())
+    if not await inflight_updates.wait(shutdown_time_left()):
+        print(f"Не дождались {inflight_updates.count} апдейтов: вышло время остановки")
+
+# Dispatcher первым shutdown-хендлером закрывает FSM-хранилище, а апдейты
+# должны успеть дописать в него состояние — поэтому встаём перед ним
+dp.shutdown.handlers.insert(0, HandlerObject(callback=drain_updates))
+
+async def drain_log_spool():
+    """Отправляет спул в Google Sheets, пока он не опустеет или не выйдет срок остановки"""
+    spool = get_log_spool()
+    while len(spool) and shutdown_time_left():
+        try:
+            if not await asyncio.wait_for(flush_logs(), shutdown_time_left()):
+                break
+        except asyncio.TimeoutError:
+            break
+    if len(spool):
+        print(f"В спуле логов осталось {len(spool)} строк, они отправятся после перезапуска")
+
+async def warm_up_catalog():
+    """
+    Снапшот каталога, затем у лидера условный запрос CSV — он же открывает
+    соединения пула. Старт ждёт сети, только если снапшота нет: иначе бот
+    отвечает по снапшоту, а CSV догружается в фоне.
+    """
+    get_http_session()
+    await load_catalog_snapshot()
+    if not is_leader:
+        return
+    if component_cache is None:
+        await asyncio.shield(schedule_component_refresh())
+    else:
+        schedule_component_refresh()
+
 async def on_startup():
-    # Запускаем фоновую задачу для периодической отправки логов
-    asyncio.create_task(log_worker())
-    print("Log worker started")
+    global bot_thread_id
+    started = time.perf_counter()
+    bot_thread_id = threading.get_ident()
+    if SLOW_CALL_THRESHOLD_MS:
+        slow_calls.enable(SLOW_CALL_THRESHOLD_MS / 1000)
+
+    leader = try_become_leader()
+    loop = asyncio.get_running_loop()
+    steps = {
+        # Кэш file_id картинок переживает перезапуск
+        "file_ids": lambda: loop.run_in_executor(None, file_id_cache.load),
+        "catalog": warm_up_catalog,
+        # Первый запрос к Bot API открывает соединение общего пула; polling потом берёт бота из кэша
+        "bot_api": bot.me,
+    }
+    if leader:
+        # Подключение к листу логов (и импорт gspread) — до первого батча, а не во время него
+        steps["sheets"] = lambda: loop.run_in_executor(sheets_executor, get_worksheet)
+    await startup_timer.warm_up(steps, STARTUP_WARMUP_TIMEOUT)
+
+    if leader:
+        start_leader_tasks()
+    else:
+        asyncio.create_task(follower_loop())
+
+    startup_timer.mark("startup", started)
+    for phase, seconds in startup_timer.phases.items():
+        metrics.startup_duration.labels(phase).set(seconds)
+    print("Старт:", startup_timer.summary())
+
+async def on_shutdown():
+    if is_leader:
+        await drain_log_spool()
+        file_id_cache.save()
+    # Несохранённые изменения сессий дописываются в хранилище (если диспетчер
+    # ещё не закрыл его сам)
+    await storage.close()
+    await close_http_session()
+    print("HTTP session closed")
 
 # --- Запуск ---
+import hmac
+import secrets
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, Response
-import uvicorn
-from threading import Thread
 
-app = FastAPI()
+# Режим webhook включается адресом; без него бот работает через long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный адрес сервиса, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# X-Telegram-Bot-Api-Secret-Token; без него любой, кто дотянется до WEBHOOK_PATH,
+# подделает апдейт (в том числе from.id администратора), поэтому если секрет
+# не задан, run_webhook генерирует его сам
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", 64))  # апдейтов в обработке
+WEBHOOK_QUEUE_TIMEOUT = float(os.getenv("WEBHOOK_QUEUE_TIMEOUT", 5))  # секунд ждать свободного слота
+PORT = int(os.getenv("PORT", 10000))
+
+@asynccontextmanager
+async def webhook_lifespan(app):
+    """В режиме webhook каждый процесс uvicorn поднимает бота в своём event loop"""
+    if not WEBHOOK_URL:
+        yield
+        return
+    await on_startup()
+    await dp.emit_startup(bot=bot)
+    try:
+        yield
+    finally:
+        # uvicorn уже перестал принимать запросы; shutdown-хендлеры дожидаются начатых апдейтов
+        begin_shutdown()
+        await dp.emit_shutdown(bot=bot)
+        await on_shutdown()
+
+app = FastAPI(lifespan=webhook_lifespan)
+
+update_slots = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY)
+update_tasks = set()
 
 @app.middleware("http")
 async def handle_head_request(request: Request, call_next):
@@ -592,33 +1755,157 @@ async def handle_head_request(request: Request, call_next):
 def health_check():
     return {"status": "Bot is running"}
 
-def run_fastapi():
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/catalog/changes")
+def catalog_changes_report():
+    """Что менялось в каталоге при последних обновлениях CSV, новые — в конце"""
+    return {"version": component_csv_hash, "components": len(component_cache or ()), "changes": list(catalog_changes)}
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10):
+    """Профиль бота за seconds секунд в формате collapsed stacks"""
+    if not PROFILING_TOKEN:
+        return Response(status_code=404)
+    token = request.headers.get("X-Profiling-Token", "")
+    if not hmac.compare_digest(token, PROFILING_TOKEN):
+        return Response(status_code=403)
+    if profiler.running:
+        return Response(status_code=409)
+
+    profiler.start(PROFILE_INTERVAL, bot_thread_id)
+    try:
+        await asyncio.sleep(min(max(seconds, 0), PROFILE_MAX_SECONDS))
+    finally:
+        collapsed = profiler.stop()
+    return Response(
+        content=collapsed, media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="profile-{datetime.now():%Y%m%d-%H%M%S}.collapsed"'}
+    )
+
+async def process_update(update: Update):
+    try:
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        print(f"❌ Ошибка обработки апдейта {update.update_id}: {e}")
+    finally:
+        update_slots.release()
+
+@app.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    # В режиме polling апдейты приходят не сюда
+    if not WEBHOOK_URL:
+        return Response(status_code=404)
+
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        return Response(status_code=403)
+
+    # Все слоты заняты — отвечаем ошибкой, и Telegram повторит доставку позже
+    try:
+        await asyncio.wait_for(update_slots.acquire(), WEBHOOK_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return Response(status_code=503)
+
+    try:
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+    except Exception:
+        update_slots.release()
+        return Response(status_code=400)
+
+    # Отвечаем сразу, апдейт обрабатывается в фоне
+    task = asyncio.create_task(process_update(update))
+    update_tasks.add(task)
+    task.add_done_callback(update_tasks.discard)
+    return Response(status_code=200)
+
+async def run_bot():
+    """
+    Polling. Health check и /metrics обслуживает uvicorn в том же event loop:
+    порт открыт сразу, ещё во время прогрева, а сигналы остановки ловит бот
+    """
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, request_stop)
+    server = embedded_server(app, host="0.0.0.0", port=PORT, timeout_keep_alive=60, limit_concurrency=100)
+    server_task = asyncio.create_task(server.serve())
+
+    try:
+        await on_startup()
+        # Оставшийся от webhook-режима вебхук не даст получать апдейты polling-ом
+        await bot.delete_webhook()
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+        stopped = asyncio.create_task(stop_requested.wait())
+        await asyncio.wait((polling, stopped), return_when=asyncio.FIRST_COMPLETED)
+        if not polling.done():
+            # Новые апдейты больше не запрашиваем; shutdown-хендлеры диспетчера дожидаются начатых
+            await dp.stop_polling()
+        stopped.cancel()
+        await polling
+    finally:
+        await on_shutdown()
+        server.should_exit = True
+        await server_task
+        await bot.session.close()
+
+async def set_webhook():
+    try:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(WEBHOOK_MAX_CONCURRENCY * WORKERS, 100)
+        )
+    finally:
+        await bot.session.close()
+    print(f"Webhook mode: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}, workers: {WORKERS}")
+
+def run_webhook():
+    """
+    FastAPI принимает апдейты и обрабатывает их в том же event loop, что и бот.
+    Процессов несколько — uvicorn запускает их сам через spawn.
+    """
+    import uvicorn
+
+    global WEBHOOK_SECRET
+    if not WEBHOOK_SECRET:
+        # Через окружение секрет получат и процессы-воркеры, которых запускает uvicorn
+        WEBHOOK_SECRET = os.environ["WEBHOOK_SECRET"] = secrets.token_urlsafe(32)
+        print("WEBHOOK_SECRET не задан — вебхук регистрируется со случайным секретом")
+    asyncio.run(set_webhook())
+    if WORKERS > 1:
+        # Каждый процесс пишет метрики в общий каталог, /metrics собирает их вместе
+        import tempfile
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="bot-metrics-"))
     uvicorn.run(
-        app,
+        # Дочерний процесс при spawn уже выполнил этот файл как __main__;
+        # импорт под именем bot выполнил бы его второй раз и удвоил время старта
+        app if WORKERS == 1 else "__main__:app",
         host="0.0.0.0",
-        port=int(os.getenv("PORT", 10000)),
+        port=PORT,
+        workers=WORKERS,
         timeout_keep_alive=60,
-        limit_concurrency=100
+        # При остановке запрос дольше всего ждёт слот; потом lifespan дожидается апдейтов и логов
+        timeout_graceful_shutdown=WEBHOOK_QUEUE_TIMEOUT,
+        # Апдейты ограничивает семафор, остальное — запас для health check
+        limit_concurrency=WEBHOOK_MAX_CONCURRENCY + 100
     )
 
-async def run_bot():
-    # Запускаем воркер логирования
-    await on_startup()
-    await dp.start_polling(bot)
+startup_timer.mark("import", IMPORT_STARTED)
 
-if __name__ == "__main__":
-    fastapi_thread = Thread(
-        target=run_fastapi,
-        daemon=True,
-        name="FastAPI Thread"
-    )
-    fastapi_thread.start()
-    
+if __name__ == "__main__" and WEBHOOK_URL:
+    try:
+        run_webhook()
+    finally:
+        print("Bot stopped gracefully")
+
+elif __name__ == "__main__":
+    if WORKERS > 1:
+        print("WORKERS > 1 работает только в режиме webhook, polling идёт в одном процессе")
     try:
         asyncio.run(run_bot())
-    except KeyboardInterrupt:
-        # При завершении пытаемся отправить оставшиеся логи
-        asyncio.run(flush_logs())
-        pass
     finally:
-        print("Bot stopped gracefully")
\ No newline at end of file
+        print("Bot stopped gracefully")
@@ -0,0 +1,201 @@
+import codecs
+import csv
+import sys
+
+# --- Записи каталога и потоковый разбор CSV ---
+# Из CSV берутся только колонки, которые нужны боту
+COLUMNS = ("Component", "File", "Tags", "Link", "Image")
+# Значения этих колонок повторяются от строки к строке — храним одну копию
+INTERNED_COLUMNS = ("File",)
+
+
+class Component:
+    """
+    Запись каталога: пять полей в __slots__ вместо словаря на строку.
+    Поддерживает чтение как словарь (r["Component"], r.get("Tags")), чтобы
+    код, работавший с csv.DictReader, не менялся.
+    """
+
+    __slots__ = COLUMNS
+
+    def __init__(self, component="", file="", tags="", link="", image=""):
+        self.Component = component
+        self.File = file
+        self.Tags = tags
+        self.Link = link
+        self.Image = image
+
+    def __getitem__(self, key):
+        if key not in COLUMNS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in COLUMNS else default
+
+    def keys(self):
+        return COLUMNS
+
+    def values(self):
+        return tuple(getattr(self, key) for key in COLUMNS)
+
+    def items(self):
+        return tuple(zip(COLUMNS, self.values()))
+
+    def __eq__(self, other):
+        return isinstance(other, Component) and self.values() == other.values()
+
+    def __hash__(self):
+        return hash(self.values())
+
+    def __repr__(self):
+        return f"Component({self.Component!r}, {self.File!r})"
+
+    def __reduce__(self):
+        # Компактный pickle для снапшота: кортеж значений без имён полей
+        return Component, self.values()
+
+
+class CatalogParser:
+    """
+    Потоковый разбор CSV каталога: байты ответа подаются кусками через feed,
+    готовые записи копятся в rows. Весь текст CSV в памяти не собирается.
+
+    Запись CSV может занимать несколько строк (перевод строки внутри кавычек),
+    поэтому строки склеиваются, пока число кавычек в записи нечётное.
+    """
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.tail = ""            # незаконченная строка из прошлого куска
+        self.pending = []         # строки записи, у которой не закрыта кавычка
+        self.pending_quotes = 0
+        self.columns = None       # позиции нужных колонок в строке CSV
+        self.rows = []
+
+    def feed(self, data: bytes):
+        text = self.tail + self.decoder.decode(data)
+        lines = text.split("\n")
+        self.tail = lines.pop()
+        self._parse_lines(lines)
+
+    def close(self) -> list:
+        text = self.tail + self.decoder.decode(b"", final=True)
+        self.tail = ""
+        self._parse_lines([text] if text else [])
+        if self.pending:
+            # Незакрытая кавычка в конце файла — отдаём как есть, csv разберётся
+            self._parse_records(["\n".join(self.pending)])
+            self.pending = []
+        return self.rows
+
+    def _parse_lines(self, lines):
+        records = []
+        for line in lines:
+            quotes = line.count('"')
+            if self.pending or quotes & 1:
+                self.pending.append(line)
+                self.pending_quotes += quotes
+                if self.pending_quotes & 1:
+                    continue
+                line = "\n".join(self.pending)
+                self.pending = []
+                self.pending_quotes = 0
+            records.append(line)
+        self._parse_records(records)
+
+    def _parse_records(self, records):
+        reader = csv.reader(records)
+        if self.columns is None:
+            header = next(reader, None)
+            if header is None:
+                return
+            positions = {name.strip(): i for i, name in enumerate(header)}
+            self.columns = [positions.get(name) for name in COLUMNS]
+
+        columns = self.columns
+        interned_positions = [COLUMNS.index(name) for name in INTERNED_COLUMNS]
+        rows = self.rows
+        for values in reader:
+            if not values:
+                continue
+            fields = [values[i] if i is not None and i < len(values) else "" for i in columns]
+            for pos in interned_positions:
+                fields[pos] = sys.intern(fields[pos])
+            rows.append(Component(*fields))
+
+
+def row_key(r) -> str:
+    """Ключ строки каталога: ссылка на узел Figma, без неё — файл и название"""
+    return r["Link"].strip() or f"{r['File'].strip()}/{r['Component'].strip()}"
+
+
+def key_rows(rows) -> dict:
+    """ключ -> запись; повторяющиеся ключи различаются номером вхождения"""
+    keyed = {}
+    for r in rows:
+        key = row_key(r)
+        if key in keyed:
+            n = 2
+            while f"{key}#{n}" in keyed:
+                n += 1
+            key = f"{key}#{n}"
+        keyed[key] = r
+    return keyed
+
+
+class CatalogDiff:
+    """
+    Разница между двумя версиями каталога по ключам строк: added и removed —
+    списки (ключ, запись), changed — (ключ, старая запись, новая запись)
+    """
+
+    __slots__ = ("added", "changed", "removed")
+
+    def __init__(self, added=(), changed=(), removed=()):
+        self.added = list(added)
+        self.changed = list(changed)
+        self.removed = list(removed)
+
+    def __len__(self):
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+    def removed_records(self) -> list:
+        """Записи, которые уходят из индекса (удалённые и старые версии изменённых)"""
+        return [r for _, r in self.removed] + [old for _, old, _ in self.changed]
+
+    def added_records(self) -> list:
+        return [r for _, r in self.added] + [new for _, _, new in self.changed]
+
+    def summary(self, limit: int = 20) -> dict:
+        """Сводка для логов и /catalog/changes: счётчики и первые limit ключей"""
+        return {
+            "added": len(self.added),
+            "changed": len(self.changed),
+            "removed": len(self.removed),
+            "keys": {
+                "added": [key for key, _ in self.added[:limit]],
+                "changed": [key for key, _, _ in self.changed[:limit]],
+                "removed": [key for key, _ in self.removed[:limit]],
+            },
+        }
+
+
+def diff_catalog(old_rows, new_rows) -> CatalogDiff:
+    old = key_rows(old_rows)
+    diff = CatalogDiff()
+    for key, r in key_rows(new_rows).items():
+        previous = old.pop(key, None)
+        if previous is None:
+            diff.added.append((key, r))
+        elif previous != r:
+            diff.changed.append((key, previous, r))
+    diff.removed.extend(old.items())
+    return diff
+
+
+def parse_catalog(data: bytes) -> list:
+    """Разбор CSV целиком (для снапшотов, тестов и бенчмарков)"""
+    parser = CatalogParser()
+    parser.feed(data)
+    return parser.close()
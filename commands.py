@@ -0,0 +1,72 @@
+from aiogram.dispatcher.event.handler import HandlerObject
+
+# --- Текстовые команды (кнопки меню) ---
+MESSAGE_LIMIT = 4000  # Telegram принимает до 4096 символов в сообщении
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> tuple:
+    """
+    Режет текст на части не длиннее limit: по пустой строке, иначе по концу
+    строки, и только если их нет — посередине строки
+    """
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        parts.append(text)
+    return tuple(parts)
+
+
+class TextCommands:
+    """
+    Кнопки меню и их синонимы. Текст сообщения нормализуется один раз и ищется
+    в словаре, вместо того чтобы aiogram по очереди проверял фильтр каждого
+    хендлера.
+
+    В диспетчере группа команд — один хендлер (register). Фильтр кладёт в
+    data["handler"] хендлер найденной команды, поэтому middleware и метрики
+    видят его настоящее имя.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+
+    def __len__(self):
+        return len(self.handlers)
+
+    def command(self, *labels):
+        """Декоратор: хендлер срабатывает на любой из текстов labels"""
+        def decorator(callback):
+            handler = HandlerObject(callback=callback)
+            for label in labels:
+                key = normalize_text(label)
+                if key in self.handlers:
+                    raise ValueError(f"Текст {label!r} уже занят другой командой")
+                self.handlers[key] = handler
+            return callback
+        return decorator
+
+    def resolve(self, text):
+        return self.handlers.get(normalize_text(text)) if text else None
+
+    async def match(self, message):
+        # Асинхронный фильтр: синхронные aiogram запускает в отдельном потоке
+        handler = self.resolve(message.text)
+        return {"handler": handler} if handler else False
+
+    async def dispatch(self, message, handler: HandlerObject, **data):
+        return await handler.call(message, handler=handler, **data)
+
+    def register(self, observer):
+        """Ставит группу команд в очередь хендлеров observer (например, dp.message)"""
+        observer.register(self.dispatch, self.match)
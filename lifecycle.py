@@ -0,0 +1,85 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+# --- Жизненный цикл процесса: замеры старта, прогрев, остановка ---
+
+
+class StartupTimer:
+    """Длительность этапов старта: импорт модуля, прогрев и каждый шаг прогрева"""
+
+    def __init__(self):
+        self.phases = {}  # этап -> секунды
+
+    def mark(self, phase: str, started: float):
+        self.phases[phase] = time.perf_counter() - started
+
+    async def warm_up(self, steps: dict, timeout: float):
+        """
+        Запускает шаги прогрева (имя -> функция без аргументов, возвращающая
+        корутину) параллельно. Шаг, который упал или не уложился в timeout,
+        пропускается: бот стартует и без него, просто первый запрос будет медленнее.
+        """
+        async def run(name, step):
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(step(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Прогрев {name}: не уложился в {timeout:g} с")
+            except Exception as e:
+                print(f"Прогрев {name}: ошибка {e}")
+            finally:
+                self.mark(f"warmup.{name}", started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run(name, step) for name, step in steps.items()))
+        self.mark("warmup", started)
+
+    def summary(self) -> str:
+        return ", ".join(f"{phase} {seconds * 1000:.0f} мс" for phase, seconds in self.phases.items())
+
+
+class InFlightUpdates:
+    """
+    Outer-middleware апдейтов: считает апдейты в обработке, чтобы при
+    остановке процесса дождаться их, а не обрывать на полпути
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def __call__(self, handler, event, data):
+        self.count += 1
+        self.idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if not self.count:
+                self.idle.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """True — все апдейты обработаны, False — вышло время"""
+        try:
+            await asyncio.wait_for(self.idle.wait(), max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+def embedded_server(app, **options):
+    """
+    uvicorn-сервер для запуска в уже работающем event loop (await server.serve()).
+    Сигналы он не перехватывает — остановкой процесса управляет бот, а сервер
+    останавливается через server.should_exit = True.
+    """
+    import uvicorn  # нужен только при запуске, не при импорте модуля бота
+
+    class EmbeddedServer(uvicorn.Server):
+        @contextmanager
+        def capture_signals(self):
+            yield
+
+    return EmbeddedServer(uvicorn.Config(app, **options))
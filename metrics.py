@@ -0,0 +1,134 @@
+import os
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+)
+
+# --- Метрики Prometheus ---
+# При нескольких процессах (WORKERS > 1) prometheus_client пишет значения в
+# файлы каталога PROMETHEUS_MULTIPROC_DIR, а /metrics собирает их со всех процессов.
+
+# Бакеты в секундах: от быстрых хендлеров и поиска до медленной загрузки CSV
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SLOW_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+handler_latency = Histogram(
+    "bot_handler_duration_seconds", "Время обработки апдейта хендлером",
+    ["event_type", "handler"], buckets=FAST_BUCKETS
+)
+handler_errors = Counter(
+    "bot_handler_errors_total", "Исключения в хендлерах", ["event_type", "handler"]
+)
+search_latency = Histogram(
+    "bot_search_duration_seconds", "Время поиска по индексу каталога", buckets=FAST_BUCKETS
+)
+search_cache_requests = Counter(
+    "bot_search_cache_requests_total", "Кэш результатов поиска: hit, miss или prewarm (прогрев после обновления)",
+    ["result"]
+)
+csv_fetch_latency = Histogram(
+    "bot_csv_fetch_duration_seconds", "Загрузка CSV каталога", ["status"], buckets=SLOW_BUCKETS
+)
+csv_parse_latency = Histogram(
+    "bot_csv_parse_duration_seconds", "Разбор CSV и построение индекса", buckets=SLOW_BUCKETS
+)
+catalog_requests = Counter(
+    "bot_catalog_requests_total", "Обращения к кэшу каталога: hit, stale (отдан устаревший) или miss",
+    ["result"]
+)
+catalog_loads = Counter(
+    "bot_catalog_loads_total",
+    "Загрузки CSV каталога: started, coalesced (присоединились к идущей), not_modified (304) или failed",
+    ["result"]
+)
+catalog_row_changes = Counter(
+    "bot_catalog_row_changes_total", "Строки каталога, изменившиеся при обновлении CSV: added, changed, removed",
+    ["kind"]
+)
+inline_cache_requests = Counter(
+    "bot_inline_cache_requests_total", "LRU страниц инлайн-поиска: hit или miss", ["result"]
+)
+file_id_cache_requests = Counter(
+    "bot_file_id_cache_requests_total", "Кэш file_id картинок: hit или miss", ["result"]
+)
+log_spool_depth = Gauge(
+    "bot_log_spool_depth", "Строк лога, ожидающих отправки в Google Sheets", multiprocess_mode="max"
+)
+startup_duration = Gauge(
+    "bot_startup_duration_seconds", "Этапы старта процесса: import, warmup и шаги прогрева, startup",
+    ["phase"], multiprocess_mode="max"
+)
+log_flush_failures = Counter("bot_log_flush_failures_total", "Неудачные отправки логов в Google Sheets")
+log_rows_flushed = Counter("bot_log_rows_flushed_total", "Строк лога отправлено в Google Sheets")
+log_rows_dropped = Counter(
+    "bot_log_rows_dropped_total", "Строки лога, потерянные при переполнении спула или когда он занят другим процессом"
+)
+rate_limit_rejections = Counter(
+    "bot_rate_limit_rejections_total", "Апдейты, отклонённые rate limiter-ом", ["event_type"]
+)
+telegram_latency = Histogram(
+    "bot_telegram_request_duration_seconds", "Запросы к Bot API", ["method"], buckets=SLOW_BUCKETS
+)
+telegram_retry_after = Counter(
+    "bot_telegram_retry_after_total", "Ответы 429 (retry_after) от Bot API", ["method"]
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner-middleware: вызывается для каждого сработавшего хендлера, поэтому
+    новые хендлеры попадают в метрики без отдельного кода
+    """
+
+    def __init__(self, event_type: str):
+        self.event_type = event_type
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.labels(self.event_type, name).inc()
+            raise
+        finally:
+            handler_latency.labels(self.event_type, name).observe(time.perf_counter() - start)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии Bot API: время каждого запроса и ответы 429"""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            telegram_retry_after.labels(name).inc()
+            raise
+        finally:
+            telegram_latency.labels(name).observe(time.perf_counter() - start)
+
+
+def instrument(dp, bot):
+    """Вешает middleware метрик на все типы апдейтов диспетчера и на сессию бота"""
+    for event_type, observer in dp.observers.items():
+        if event_type != "update":
+            observer.middleware(HandlerMetricsMiddleware(event_type))
+    bot.session.middleware(TelegramMetricsMiddleware())
+
+
+def render():
+    """Тело и Content-Type ответа /metrics"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
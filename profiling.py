@@ -0,0 +1,198 @@
+import asyncio
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+# --- Профилирование работающего бота ---
+# Всё выключено по умолчанию и ничего не стоит, пока выключено: поток
+# профилировщика запускается только на время замера, а трассировка медленных
+# вызовов подменяет функции и вешает middleware только пока включена.
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик: отдельный поток каждые interval секунд
+    снимает стек потока event loop и считает одинаковые стеки. Результат —
+    collapsed stacks («кадр;кадр;кадр число»), из которых flamegraph.pl или
+    speedscope строят flame graph.
+    """
+
+    def __init__(self):
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    MIN_INTERVAL = 0.001  # при interval=0 поток крутился бы без пауз и отнимал GIL
+
+    def start(self, interval: float = 0.01, thread_id: int = None):
+        """Начинает замер; thread_id — поток, который профилируем (по умолчанию текущий)"""
+        if self.running:
+            raise RuntimeError("Профилировщик уже запущен")
+        if not interval >= self.MIN_INTERVAL:
+            raise ValueError(f"interval меньше {self.MIN_INTERVAL} с")
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self._sample, args=(thread_id or threading.get_ident(), interval),
+            name="sampling-profiler", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self) -> str:
+        """Останавливает замер и возвращает collapsed stacks"""
+        if not self.running:
+            raise RuntimeError("Профилировщик не запущен")
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _sample(self, thread_id: int, interval: float):
+        while not self.stop_event.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+
+def coroutine_stack(coro) -> list:
+    """Цепочка await корутины: где она сейчас ждёт (от внешней к внутренней)"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return traceback.format_list(traceback.StackSummary.extract((f, f.f_lineno) for f in frames))
+
+
+class SlowCallMiddleware:
+    """Inner-middleware: хендлер диспетчера дольше порога попадает в лог"""
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        return await self.tracer.run(f"handler {name}", handler(event, data))
+
+
+class SlowCallTracer:
+    """
+    Пишет в лог вызовы дольше threshold секунд вместе со стеком. Если вызов
+    всё ещё идёт, когда порог пройден, — стек того места, где он ждёт; если
+    он держал event loop и завершился — стек вызывающего кода.
+
+    enable подменяет функции names в namespace (globals() модуля бота)
+    обёртками и вешает middleware на observers; disable всё возвращает.
+    """
+
+    def __init__(self, namespace: dict, names, observers):
+        self.namespace = namespace
+        self.names = tuple(names)
+        self.observers = list(observers)
+        self.threshold = None
+        self.originals = {}
+        self.middleware = SlowCallMiddleware(self)
+        self.slow_calls = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold is not None
+
+    def enable(self, threshold: float):
+        self.threshold = threshold
+        if self.originals:
+            return  # уже включено, поменялся только порог
+        for name in self.names:
+            original = self.originals[name] = self.namespace[name]
+            self.namespace[name] = self._wrap(name, original)
+        for observer in self.observers:
+            observer.middleware(self.middleware)
+
+    def disable(self):
+        self.threshold = None
+        if not self.originals:
+            return
+        for name, original in self.originals.items():
+            self.namespace[name] = original
+        self.originals = {}
+        for observer in self.observers:
+            observer.middleware.unregister(self.middleware)
+
+    def _wrap(self, name, func):
+        @functools.wraps(func)
+        async def traced(*args, **kwargs):
+            return await self.run(name, func(*args, **kwargs))
+        return traced
+
+    async def run(self, name: str, coro):
+        threshold = self.threshold
+        if threshold is None:
+            return await coro
+        started = time.perf_counter()
+        reported = []
+        watchdog = asyncio.get_running_loop().call_later(
+            threshold, self._report_pending, name, coro, started, reported
+        )
+        try:
+            return await coro
+        finally:
+            watchdog.cancel()
+            elapsed = time.perf_counter() - started
+            if elapsed >= threshold:
+                self.slow_calls += 1
+                print(f"⏱ {name}: {elapsed * 1000:.0f} мс (порог {threshold * 1000:.0f} мс)")
+                if not reported:
+                    # Вызов держал event loop и сторож не успел сработать: показываем, откуда его позвали
+                    print("".join(traceback.format_stack(limit=12)[:-1]), end="")
+
+    def _report_pending(self, name: str, coro, started: float, reported: list):
+        reported.append(True)
+        elapsed = time.perf_counter() - started
+        print(f"⏱ {name} выполняется уже {elapsed * 1000:.0f} мс, сейчас ждёт в:")
+        print("".join(coroutine_stack(coro)), end="")
+
+
+def set_slow_callback_detection(loop, threshold):
+    """
+    Отладочный режим asyncio: колбэки и шаги корутин дольше threshold секунд
+    попадают в лог («Executing ... took N seconds»). threshold=None выключает.
+    """
+    logger = logging.getLogger("asyncio")
+    if threshold is None:
+        loop.set_debug(False)
+        return
+    if not logger.handlers and not logging.getLogger().handlers:
+        logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.WARNING)
+    loop.slow_callback_duration = threshold
+    loop.set_debug(True)
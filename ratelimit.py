@@ -0,0 +1,187 @@
+import asyncio
+import time
+
+# --- Token bucket rate limiter ---
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """
+    Token bucket на ключ: burst запросов подряд, дальше rate запросов в секунду.
+
+    На ключ хранится один объект из двух float. Словарь упорядочен по времени
+    последнего обращения, поэтому простаивающие ключи лежат в начале и
+    вытесняются за O(вытесненных) без обхода всего словаря. Ведро, которое
+    простояло burst / rate секунд, снова полное — удалить его то же самое,
+    что оставить. Исключение — ведро, ушедшее в минус через reserve: его долг
+    надо помнить, пока он не погашен.
+    """
+
+    def __init__(self, rate: float, burst: int, sweep_interval: float = 60):
+        self.rate = rate
+        self.burst = burst
+        self.idle_ttl = burst / rate
+        self.sweep_interval = sweep_interval
+        self.buckets = {}
+        self.last_sweep = 0.0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def _refill(self, key, now: float) -> TokenBucket:
+        if now - self.last_sweep >= self.sweep_interval:
+            self.evict_idle(now)
+
+        # pop + вставка переносят ключ в конец словаря: он снова самый свежий
+        bucket = self.buckets.pop(key, None)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        self.buckets[key] = bucket
+        return bucket
+
+    def allow(self, key, now: float = None) -> bool:
+        bucket = self._refill(key, time.monotonic() if now is None else now)
+        if bucket.tokens < 1:
+            self.rejected += 1
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def reserve(self, key, cost: float = 1, now: float = None) -> float:
+        """
+        Резервирует cost токенов и возвращает, сколько секунд подождать до их
+        появления. Ведро может уйти в минус — следующие резервирования встают в
+        очередь за уже выданными.
+        """
+        bucket = self._refill(key, time.monotonic() if now is None else now)
+        bucket.tokens -= cost
+        return max(0.0, -bucket.tokens / self.rate)
+
+    def evict_idle(self, now: float = None) -> int:
+        """Удаляет ключи, ведра которых снова полные; возвращает их число"""
+        if now is None:
+            now = time.monotonic()
+        self.last_sweep = now
+        deadline = now - self.idle_ttl
+
+        idle = []
+        for key, bucket in self.buckets.items():
+            if bucket.updated > deadline:
+                break
+            if bucket.tokens + (now - bucket.updated) * self.rate >= self.burst:
+                idle.append(key)
+        for key in idle:
+            del self.buckets[key]
+        return len(idle)
+
+
+# --- Общий для нескольких процессов rate limiter ---
+# Тот же token bucket, но ведра лежат во внешнем хранилище, поэтому лимит
+# действует на пользователя целиком, а не на каждый процесс бота отдельно.
+# allow у них асинхронный.
+
+class SQLiteRateLimiter:
+    """
+    Ведра в таблице SQLite: подходит для нескольких процессов на одной машине.
+    Проверка — одна короткая транзакция BEGIN IMMEDIATE в отдельном потоке.
+    """
+
+    def __init__(self, path: str, name: str, rate: float, burst: int, sweep_interval: float = 60):
+        import sqlite3
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.idle_ttl = burst / rate
+        self.sweep_interval = sweep_interval
+        self.last_sweep = 0.0
+        self.rejected = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"ratelimit-{name}")
+        self.db = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS ratelimit ("
+            "name TEXT, key TEXT, tokens REAL, updated REAL, PRIMARY KEY (name, key)"
+            ") WITHOUT ROWID"
+        )
+
+    def _take(self, key: str, now: float) -> bool:
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if now - self.last_sweep >= self.sweep_interval:
+                self.last_sweep = now
+                db.execute("DELETE FROM ratelimit WHERE name = ? AND updated <= ?", (self.name, now - self.idle_ttl))
+            row = db.execute(
+                "SELECT tokens, updated FROM ratelimit WHERE name = ? AND key = ?", (self.name, key)
+            ).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            db.execute(
+                "INSERT OR REPLACE INTO ratelimit (name, key, tokens, updated) VALUES (?, ?, ?, ?)",
+                (self.name, key, tokens, now)
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return allowed
+
+    async def allow(self, key) -> bool:
+        # Время стенное: монотонные часы у разных процессов не совпадают
+        loop = asyncio.get_running_loop()
+        allowed = await loop.run_in_executor(self.executor, self._take, str(key), time.time())
+        if not allowed:
+            self.rejected += 1
+        return allowed
+
+
+class RedisRateLimiter:
+    """
+    Ведра в Redis: подходит и для нескольких машин. Пополнение и списание
+    делает Lua-скрипт за один атомарный вызов; простаивающие ведра удаляет
+    сам Redis по PEXPIRE.
+    """
+
+    SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+    return allowed
+    """
+
+    def __init__(self, redis, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.rejected = 0
+        self.script = redis.register_script(self.SCRIPT)
+
+    async def allow(self, key) -> bool:
+        allowed = await self.script(keys=[f"ratelimit:{self.name}:{key}"], args=[self.rate, self.burst, time.time()])
+        if not allowed:
+            self.rejected += 1
+        return bool(allowed)
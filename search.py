@@ -0,0 +1,504 @@
+import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import chain
+
+# --- Поисковый индекс по каталогу компонентов ---
+TOKEN_RE = re.compile(r"\w+")
+
+PREFIX_MIN_LEN = 2   # префиксы короче не раскрываем
+PREFIX_LIMIT = 64    # сколько токенов словаря максимум подставляем под префикс
+FUZZY_MIN_LEN = 4    # опечатки ищем только в словах не короче
+FUZZY_CANDIDATES = 16
+TOKEN_CACHE_SIZE = 4096  # сколько разобранных слов запроса индекс помнит
+LAZY_EXPAND_LIMIT = 32   # больше id за раз разворачиваем всю группу сразу
+
+TYPES = ("mobile", "web", "icon")
+
+# Смещения установленных битов для каждого 16-битного слова маски
+WORD_BITS = tuple(tuple(bit for bit in range(16) if value >> bit & 1) for value in range(1 << 16))
+
+
+def normalize(text: str) -> str:
+    """Приводит строку к виду, в котором хранится индекс"""
+    return ' '.join((text or "").lower().replace("ё", "е").split())
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_RE.findall(normalize(text))
+
+
+def trigrams(token: str) -> set:
+    padded = f"^{token}$"
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+def max_typos(token: str) -> int:
+    return 1 if len(token) < 8 else 2
+
+
+def within_distance(a: str, b: str, limit: int) -> bool:
+    """Расстояние Левенштейна между a и b не больше limit"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+
+    # Общие префикс и суффикс на расстояние не влияют
+    shortest = min(len(a), len(b))
+    start = 0
+    while start < shortest and a[start] == b[start]:
+        start += 1
+    tail = 0
+    while tail < shortest - start and a[-1 - tail] == b[-1 - tail]:
+        tail += 1
+    a = a[start:len(a) - tail]
+    b = b[start:len(b) - tail]
+    if max(len(a), len(b)) <= limit:
+        return True
+    if limit == 0:
+        return False
+
+    # Первые символы различаются: замена, удаление или вставка
+    return (within_distance(a[1:], b[1:], limit - 1)
+            or within_distance(a[1:], b, limit - 1)
+            or within_distance(a, b[1:], limit - 1))
+
+
+def sort_key(r) -> str:
+    return r["Component"].lower()
+
+
+def analyze(r) -> tuple:
+    """Ключи записи в индексе: (теги целиком, токены названия, токены тегов)"""
+    phrases = tuple(dict.fromkeys(normalize(t) for t in (r.get("Tags", "") or "").split(",")))
+    tag_tokens = set()
+    for tag in phrases:
+        tag_tokens.update(TOKEN_RE.findall(tag))
+    return phrases, set(tokenize(r.get("Component", ""))), tag_tokens
+
+
+def ids_to_mask(ids) -> int:
+    """Множество id -> битовая маска (int), бит i установлен для id i"""
+    ids = list(ids)
+    if not ids:
+        return 0
+    data = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        data[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(data, "little")
+
+
+def mask_to_ids(mask: int) -> list:
+    """Битовая маска -> id по возрастанию"""
+    ids = []
+    if mask.bit_count() <= 32:
+        while mask:
+            low = mask & -mask
+            ids.append(low.bit_length() - 1)
+            mask ^= low
+        return ids
+
+    words = array("H")
+    words.frombytes(mask.to_bytes((mask.bit_length() + 15) // 16 * 2, "little"))
+    if sys.byteorder == "big":
+        words.byteswap()
+    for pos, word in enumerate(words):
+        if word:
+            ids.extend(map((pos << 4).__add__, WORD_BITS[word]))
+    return ids
+
+
+class SearchResult:
+    """
+    id найденных записей по убыванию релевантности (len, срезы, итерация).
+
+    Внутри это группы записей с равными очками — битовые маски от лучшей к
+    худшей. id группы разворачиваются, только когда до неё доходит срез:
+    первой странице не нужно строить список из тысяч найденных записей.
+    """
+
+    __slots__ = ("index", "groups", "length", "ids", "next_group", "rest")
+
+    def __init__(self, index, groups, length):
+        self.index = index
+        self.groups = groups
+        self.length = length
+        self.ids = []        # уже развёрнутые id
+        self.next_group = 0  # первая группа, к которой ещё не подходили
+        self.rest = 0        # неразвёрнутый остаток текущей группы
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        self._expand(self.length)
+        return iter(self.ids)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.length)
+            if step < 0:
+                self._expand(self.length)
+                return self.ids[item]
+            self._expand(stop)
+            return self.ids[start:stop:step]
+        if item < 0:
+            item += self.length
+        self._expand(item + 1)
+        return self.ids[item]
+
+    def _expand(self, stop: int):
+        """Разворачивает группы, пока в ids не наберётся stop id"""
+        ids = self.ids
+        while len(ids) < stop:
+            rest = self.rest
+            if not rest:
+                if self.next_group == len(self.groups):
+                    return
+                rest = self.groups[self.next_group]
+                self.next_group += 1
+            if stop - len(ids) > LAZY_EXPAND_LIMIT or rest.bit_count() <= LAZY_EXPAND_LIMIT \
+                    or rest >> self.index.sorted_count:
+                # Группа целиком (у дописанных записей место по названию известно только после сортировки)
+                ids.extend(self.index._ordered_ids(rest))
+                rest = 0
+            else:
+                while rest and len(ids) < stop:
+                    low = rest & -rest
+                    ids.append(low.bit_length() - 1)
+                    rest ^= low
+            self.rest = rest
+
+
+class SearchIndex:
+    """
+    Неизменяемый индекс по записям каталога.
+
+    Записи хранятся в records отсортированными по названию компонента, а id
+    записи — её позиция в records, поэтому id по возрастанию — это и есть
+    порядок по названию. Исключение — записи, дописанные в конец через
+    updated (id от sorted_count и дальше): их место по названию находится при
+    поиске, а удалённые записи оставляют в records None. Posting-листы хранятся битовыми масками (int) отдельно
+    для каждого типа компонентов: пересечение и объединение — одна операция над
+    int, а фильтрация по типу ничего не стоит.
+
+    Слово запроса совпадает с записью на одном из уровней (от лучшего к
+    худшему): точное слово в названии, в тегах, префикс в названии, в тегах,
+    опечатка в названии, в тегах. Очки слова — число уровней не хуже
+    достигнутого, очки записи — сумма по словам. Запрос, целиком равный тегу,
+    поднимает такие записи наверх (так работал исходный поиск по тегам).
+    """
+
+    def __init__(self, records, type_of):
+        self.records = sorted(records, key=sort_key)
+        self.types = [type_of(r) for r in self.records]
+        self.sorted_count = len(self.records)  # id меньше — в порядке названий
+        self.live = len(self.records)
+
+        phrases = {t: {} for t in TYPES}
+        names = {t: {} for t in TYPES}
+        tags = {t: {} for t in TYPES}
+
+        for row_id, r in enumerate(self.records):
+            type_ = self.types[row_id]
+            phrase_keys, name_tokens, tag_tokens = analyze(r)
+            for tag in phrase_keys:
+                phrases[type_].setdefault(tag, []).append(row_id)
+            for token in tag_tokens:
+                tags[type_].setdefault(token, []).append(row_id)
+            for token in name_tokens:
+                names[type_].setdefault(token, []).append(row_id)
+
+        def to_masks(postings):
+            return {t: {key: ids_to_mask(ids) for key, ids in postings[t].items()} for t in TYPES}
+
+        self.phrase_masks = to_masks(phrases)  # тип -> тег целиком -> маска
+        self.name_masks = to_masks(names)      # тип -> токен названия -> маска
+        self.tag_masks = to_masks(tags)        # тип -> токен тегов -> маска
+
+        vocabulary = set()
+        for type_ in TYPES:
+            vocabulary.update(names[type_])
+            vocabulary.update(tags[type_])
+        self.vocabulary = sorted(vocabulary)
+
+        self.trigram_index = {}  # длина токена -> триграмма -> [токен]
+        for token in self.vocabulary:
+            if len(token) >= FUZZY_MIN_LEN - 2:
+                grams = self.trigram_index.setdefault(len(token), {})
+                for gram in trigrams(token):
+                    grams.setdefault(gram, []).append(token)
+
+        self._token_cache = {}
+        self._word_cache = {}
+
+    def __len__(self):
+        return self.live
+
+    def live_records(self) -> list:
+        return [r for r in self.records if r is not None]
+
+    @property
+    def fragmentation(self) -> float:
+        """Доля id, занятых удалёнными или дописанными не по порядку записями"""
+        total = len(self.records)
+        return ((total - self.live) + (total - self.sorted_count)) / total if total else 0.0
+
+    def updated(self, removed, added, type_of):
+        """
+        Новый индекс: self без записей removed (объекты из self.records) и с
+        записями added. Меняются только posting-листы этих записей; self не
+        трогается, поэтому начатые по нему поиски видят прежний каталог.
+        Запись с тем же названием занимает id удалённой, остальные дописываются
+        в конец.
+        """
+        index = object.__new__(SearchIndex)
+        index.__dict__.update(self.__dict__)
+        index.records = self.records[:]
+        index.types = self.types[:]
+        index.live = self.live - len(removed) + len(added)
+        index._token_cache = {}
+        index._word_cache = {}
+
+        # Словари масок копируются при первой записи в них
+        for name in ("phrase_masks", "name_masks", "tag_masks"):
+            setattr(index, name, dict(getattr(self, name)))
+        copied = set()
+
+        def writable(kind_masks, type_):
+            if (id(kind_masks), type_) not in copied:
+                copied.add((id(kind_masks), type_))
+                kind_masks[type_] = kind_masks[type_].copy()
+            return kind_masks[type_]
+
+        touched_tokens = set()
+
+        def toggle(r, row_id, type_, on):
+            bit = 1 << row_id
+            phrase_keys, name_tokens, tag_tokens = analyze(r)
+            for kind_masks, keys in ((index.phrase_masks, phrase_keys), (index.name_masks, name_tokens),
+                                     (index.tag_masks, tag_tokens)):
+                masks = writable(kind_masks, type_)
+                for key in keys:
+                    mask = masks.get(key, 0) | bit if on else masks.get(key, 0) & ~bit
+                    if mask:
+                        masks[key] = mask
+                    else:
+                        masks.pop(key, None)
+                if kind_masks is not index.phrase_masks:
+                    touched_tokens.update(keys)
+
+        position = {id(r): row_id for row_id, r in enumerate(self.records) if r is not None}
+        free = {}
+        for r in removed:
+            row_id = position.pop(id(r))
+            toggle(r, row_id, index.types[row_id], False)
+            index.records[row_id] = None
+            free.setdefault(sort_key(r), []).append(row_id)
+
+        for r in added:
+            type_ = type_of(r)
+            slots = free.get(sort_key(r))
+            if slots:
+                row_id = slots.pop()
+                index.records[row_id] = r
+                index.types[row_id] = type_
+            else:
+                row_id = len(index.records)
+                index.records.append(r)
+                index.types.append(type_)
+            toggle(r, row_id, type_, True)
+
+        index._update_vocabulary(touched_tokens)
+        return index
+
+    def _update_vocabulary(self, tokens):
+        """Добавляет в словарь и триграммы новые токены, убирает исчезнувшие"""
+        vocabulary = set(self.vocabulary)
+        present = {
+            token for token in tokens
+            if any(token in self.name_masks[t] or token in self.tag_masks[t] for t in TYPES)
+        }
+        appeared = present - vocabulary
+        gone = (tokens - present) & vocabulary
+        if not appeared and not gone:
+            return
+
+        self.vocabulary = sorted((vocabulary | appeared) - gone)
+        self.trigram_index = dict(self.trigram_index)
+        copied = set()
+        for token in appeared | gone:
+            if len(token) < FUZZY_MIN_LEN - 2:
+                continue
+            if len(token) not in copied:
+                copied.add(len(token))
+                self.trigram_index[len(token)] = dict(self.trigram_index.get(len(token), {}))
+            grams = self.trigram_index[len(token)]
+            for gram in trigrams(token):
+                if token in appeared:
+                    grams[gram] = grams.get(gram, []) + [token]
+                else:
+                    remaining = [t for t in grams.get(gram, ()) if t != token]
+                    if remaining:
+                        grams[gram] = remaining
+                    else:
+                        grams.pop(gram, None)
+
+    def _name_key(self, row_id: int) -> str:
+        return sort_key(self.records[row_id])
+
+    def _ordered_ids(self, mask: int) -> list:
+        """id из маски в порядке названий: дописанные записи встают на своё место"""
+        ids = mask_to_ids(mask)
+        if mask >> self.sorted_count:
+            split = bisect_left(ids, self.sorted_count)
+            appended = sorted(ids[split:], key=self._name_key)
+            del ids[split:]
+            for row_id in appended:
+                ids.insert(bisect_right(ids, self._name_key(row_id), key=self._name_key), row_id)
+        return ids
+
+    def __getstate__(self):
+        # Кэши разбора запросов в снапшот не попадают
+        state = self.__dict__.copy()
+        state["_token_cache"] = {}
+        state["_word_cache"] = {}
+        return state
+
+    def _prefix_tokens(self, token: str):
+        pos = bisect_left(self.vocabulary, token)
+        found = []
+        while pos < len(self.vocabulary) and len(found) < PREFIX_LIMIT:
+            candidate = self.vocabulary[pos]
+            if not candidate.startswith(token):
+                break
+            if candidate != token:
+                found.append(candidate)
+            pos += 1
+        return found
+
+    def _fuzzy_tokens(self, token: str):
+        grams = trigrams(token)
+        limit = max_typos(token)
+        # Токены, длина которых отличается больше чем на limit, заведомо не подходят
+        counts = Counter()
+        for length in range(len(token) - limit, len(token) + limit + 1):
+            by_gram = self.trigram_index.get(length)
+            if by_gram:
+                counts.update(chain.from_iterable(by_gram.get(gram, ()) for gram in grams))
+
+        # Каждая правка портит не больше трёх триграмм
+        threshold = max(1, len(grams) - 3 * limit)
+        candidates = sorted(
+            (c for c, n in counts.items() if n >= threshold and c != token),
+            key=lambda c: -counts[c]
+        )[:FUZZY_CANDIDATES]
+        return [c for c in candidates if within_distance(token, c, limit)]
+
+    def _expand(self, token: str):
+        """Токены словаря под слово запроса: (точные, префиксные, с опечаткой)"""
+        pos = bisect_left(self.vocabulary, token)
+        exact = pos < len(self.vocabulary) and self.vocabulary[pos] == token
+
+        prefix = self._prefix_tokens(token) if len(token) >= PREFIX_MIN_LEN else []
+        fuzzy = self._fuzzy_tokens(token) if not exact and len(token) >= FUZZY_MIN_LEN else []
+        return [token] if exact else [], prefix, fuzzy
+
+    def _token_masks(self, token: str, type_: str) -> list:
+        """
+        Вложенные маски «слово совпало на уровне не хуже k» для каждого уровня.
+        Индекс неизменяем, поэтому разбор слова запоминается.
+        """
+        key = (token, type_)
+        cached = self._token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        names, tags = self.name_masks[type_], self.tag_masks[type_]
+        at_least = []
+        seen = 0
+        for tokens in self._expand(token):
+            for postings in (names, tags):
+                for t in tokens:
+                    seen |= postings.get(t, 0)
+                at_least.append(seen)
+
+        if len(self._token_cache) >= TOKEN_CACHE_SIZE:
+            self._token_cache.clear()
+        self._token_cache[key] = at_least
+        return at_least
+
+    def _search_type(self, tokens, phrase, type_) -> list:
+        """
+        Группы записей с равными очками: (очки, маска) от лучшей группы к
+        худшей. Записи, у которых запрос совпал с тегом целиком, идут первой
+        группой с очками выше любых. Очки считаются одинаково для всех типов.
+        """
+        masks = [self._token_masks(token, type_) for token in tokens]
+
+        candidates = -1
+        for at_least in masks:
+            candidates &= at_least[-1]
+        if not candidates:
+            return []
+
+        # Побитовый счётчик очков: slices[j] — j-й бит суммы очков каждой записи
+        slices = []
+        for at_least in masks:
+            for mask in at_least:
+                carry = mask & candidates
+                for j in range(len(slices)):
+                    if not carry:
+                        break
+                    slices[j], carry = slices[j] ^ carry, slices[j] & carry
+                if carry:
+                    slices.append(carry)
+
+        top_score = len(tokens) * len(masks[0])
+        phrase_mask = self.phrase_masks[type_].get(phrase, 0) & candidates
+        groups = [(top_score + 1, phrase_mask)] if phrase_mask else []
+        remaining = candidates & ~phrase_mask
+
+        for score in range(top_score, 0, -1):
+            if not remaining:
+                break
+            if score >> len(slices):
+                continue
+            group = remaining
+            for j, bits in enumerate(slices):
+                group &= bits if score >> j & 1 else ~bits
+            if group:
+                groups.append((score, group))
+                remaining &= ~group
+        return groups
+
+    def _search_word(self, token, type_):
+        """Запрос из одного слова: группы результата запоминаются целиком"""
+        key = (token, type_)
+        groups = self._word_cache.get(key)
+        if groups is None:
+            if len(self._word_cache) >= TOKEN_CACHE_SIZE:
+                self._word_cache.clear()
+            groups = self._word_cache[key] = [group for _, group in self._search_type([token], token, type_)]
+        return groups
+
+    def search(self, query: str, type_=None) -> SearchResult:
+        """Возвращает id записей (позиции в records) по убыванию релевантности"""
+        phrase = normalize(query)
+        tokens = list(dict.fromkeys(TOKEN_RE.findall(phrase)))
+        if not tokens:
+            groups = []
+        elif not type_:
+            # Все типы сразу: группы с равными очками объединяются, и точное
+            # совпадение в одном типе не уступает префиксу в другом
+            merged = {}
+            for t in TYPES:
+                for score, group in self._search_type(tokens, phrase, t):
+                    merged[score] = merged.get(score, 0) | group
+            groups = [merged[score] for score in sorted(merged, reverse=True)]
+        elif tokens[0] == phrase:
+            groups = self._search_word(phrase, type_)
+        else:
+            groups = [group for _, group in self._search_type(tokens, phrase, type_)]
+        return SearchResult(self, groups, sum(group.bit_count() for group in groups))
@@ -0,0 +1,312 @@
+import asyncio
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+# --- FSM storage ---
+# Состояние и данные сессии хранятся одной записью: одно чтение и одна запись
+# на ключ вместо отдельных для state и data.
+
+
+class Record:
+    __slots__ = ("state", "data", "expires", "dirty")
+
+    def __init__(self, state=None, data=None, expires=None):
+        self.state = state
+        self.data = data or {}
+        self.expires = expires
+        self.dirty = False
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+def dump_record(record: Record) -> str:
+    return json.dumps({"state": record.state, "data": record.data}, ensure_ascii=False)
+
+
+def load_record(raw: str, expires=None) -> Record:
+    value = json.loads(raw)
+    return Record(value["state"], value["data"], expires)
+
+
+class SQLiteBackend:
+    """Записи в таблице SQLite; все запросы выполняются в отдельном потоке"""
+
+    def __init__(self, path: str):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+        )
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _get_many(self, keys):
+        placeholders = ",".join("?" * len(keys))
+        rows = self.db.execute(
+            f"SELECT key, value, expires FROM fsm WHERE key IN ({placeholders}) "
+            "AND (expires IS NULL OR expires > ?)",
+            (*keys, time.time())
+        ).fetchall()
+        return {key: load_record(value, expires) for key, value, expires in rows}
+
+    def _write_many(self, records):
+        upserts = [(k, dump_record(r), r.expires) for k, r in records.items() if not r.is_empty()]
+        deletes = [(k,) for k, r in records.items() if r.is_empty()]
+        with self.db:
+            self.db.execute("BEGIN")
+            if upserts:
+                self.db.executemany("INSERT OR REPLACE INTO fsm (key, value, expires) VALUES (?, ?, ?)", upserts)
+            if deletes:
+                self.db.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+
+    def _purge_expired(self):
+        return self.db.execute("DELETE FROM fsm WHERE expires <= ?", (time.time(),)).rowcount
+
+    async def get_many(self, keys) -> Dict[str, Record]:
+        return await self._run(self._get_many, list(keys))
+
+    async def write_many(self, records: Dict[str, Record]):
+        await self._run(self._write_many, records)
+
+    async def purge_expired(self) -> int:
+        return await self._run(self._purge_expired)
+
+    async def close(self):
+        await self._run(self.db.close)
+        self.executor.shutdown(wait=False)
+
+
+class RedisBackend:
+    """Записи в Redis (или совместимом сервере); TTL — штатный EXPIRE ключа"""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def get_many(self, keys) -> Dict[str, Record]:
+        # Значения и оставшийся TTL — одним пайплайном: без expires сессия,
+        # поднятая из Redis, в памяти процесса не истекала бы никогда
+        keys = list(keys)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.mget(keys)
+            for key in keys:
+                pipe.pttl(key)
+            values, *ttls = await pipe.execute()
+        now = time.time()
+        return {
+            key: load_record(value, now + ttl / 1000 if ttl >= 0 else None)
+            for key, value, ttl in zip(keys, values, ttls) if value is not None
+        }
+
+    async def write_many(self, records: Dict[str, Record]):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, record in records.items():
+                if record.is_empty():
+                    pipe.delete(key)
+                elif record.expires is not None:
+                    pipe.set(key, dump_record(record), px=max(1, int((record.expires - time.time()) * 1000)))
+                else:
+                    pipe.set(key, dump_record(record))
+            await pipe.execute()
+
+    async def purge_expired(self) -> int:
+        return 0
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+class TieredStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram: ограниченный LRU-кэш в памяти процесса поверх
+    постоянного бэкенда (SQLite, Redis) или без него.
+
+    - У каждого ключа свой TTL, продлеваемый при записи; просроченные сессии
+      считаются пустыми.
+    - Чтения разных ключей, пришедшие в одной итерации event loop-а, уходят в
+      бэкенд одним запросом.
+    - Записи копятся и сбрасываются в бэкенд пачкой раз в flush_interval
+      (write-behind): set_state и set_data одного апдейта дают одну запись.
+    - В памяти хранится не больше max_keys записей; вытесняются самые давние
+      из уже сохранённых в бэкенде. Без бэкенда вытеснение теряет сессию —
+      так память ограничена и в режиме memory.
+    - shared=True — бэкенд делят несколько процессов: сохранённые записи из
+      памяти не читаются (их мог изменить другой процесс), а изменения
+      уходят в бэкенд на следующей итерации event loop-а.
+    """
+
+    def __init__(self, backend=None, ttl: Optional[float] = None, max_keys: int = 10000,
+                 flush_interval: float = 0.05, key_builder=None, shared: bool = False):
+        self.backend = backend
+        self.shared = shared and backend is not None
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.flush_interval = flush_interval
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.records: "OrderedDict[str, Record]" = OrderedDict()
+        self.pending_reads: Dict[str, asyncio.Future] = {}
+        self.dirty_records: Dict[str, Record] = {}
+        self.flush_task = None
+        self.closed = False
+        self.stats = {"hits": 0, "misses": 0, "backend_reads": 0, "backend_writes": 0, "evicted": 0}
+
+    def _expires(self):
+        return time.time() + self.ttl if self.ttl else None
+
+    def _evict(self, limit=None):
+        limit = self.max_keys if limit is None else limit
+        while len(self.records) > limit:
+            for key, record in self.records.items():
+                if not record.dirty or self.backend is None:
+                    del self.records[key]
+                    self.stats["evicted"] += 1
+                    break
+            else:
+                return  # всё несохранённое — вытесним после сброса
+
+    async def _read_pending(self):
+        keys, self.pending_reads = self.pending_reads, {}
+        self.stats["backend_reads"] += 1
+        try:
+            found = await self.backend.get_many(keys)
+        except Exception as e:
+            for future in keys.values():
+                future.set_exception(e)
+            return
+        for key, future in keys.items():
+            future.set_result(found.get(key))
+
+    async def _load(self, key: str) -> Record:
+        record = self.records.get(key)
+        if record is not None and (record.dirty or not self.shared):
+            if record.expires is not None and record.expires <= time.time():
+                record.state, record.data, record.expires = None, {}, None
+            self.records.move_to_end(key)
+            self.stats["hits"] += 1
+            return record
+
+        self.stats["misses"] += 1
+        if self.backend is not None:
+            future = self.pending_reads.get(key)
+            if future is None:
+                if not self.pending_reads:
+                    asyncio.get_running_loop().call_soon(lambda: asyncio.ensure_future(self._read_pending()))
+                future = self.pending_reads[key] = asyncio.get_running_loop().create_future()
+            record = await future
+
+        # Пока ждали бэкенд, запись могла появиться из параллельного чтения
+        # или измениться в этом процессе
+        current = self.records.get(key)
+        if current is not None and (current.dirty or not self.shared):
+            self.records.move_to_end(key)
+            return current
+        self.records.pop(key, None)
+        self._evict(self.max_keys - 1)
+        record = self.records[key] = record or Record()
+        return record
+
+    def _mark_dirty(self, key: str, record: Record):
+        record.expires = self._expires()
+        if self.backend is None:
+            return
+        record.dirty = True
+        self.dirty_records[key] = record
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        # Записи, изменённые во время сброса, уходят следующей пачкой
+        while self.dirty_records:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                # Повторим при следующей записи или при закрытии
+                print(f"❌ Ошибка записи FSM-хранилища: {e}")
+                return
+
+    async def flush(self):
+        """Сбрасывает накопленные изменения в бэкенд одной пачкой"""
+        if self.backend is None or not self.dirty_records:
+            return
+        dirty, self.dirty_records = self.dirty_records, {}
+        for record in dirty.values():
+            record.dirty = False
+        try:
+            await self.backend.write_many(dirty)
+            self.stats["backend_writes"] += 1
+        except Exception:
+            for key, record in dirty.items():
+                record.dirty = True
+                self.dirty_records.setdefault(key, record)
+            raise
+        self._evict()
+
+    async def purge_expired(self) -> int:
+        """Удаляет просроченные сессии из памяти и бэкенда"""
+        now = time.time()
+        expired = [k for k, r in self.records.items() if r.expires is not None and r.expires <= now and not r.dirty]
+        for key in expired:
+            del self.records[key]
+        if self.backend is not None:
+            return len(expired) + await self.backend.purge_expired()
+        return len(expired)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        record = await self._load(storage_key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(storage_key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self.key_builder.build(key))).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        record = await self._load(storage_key)
+        record.data = dict(data)
+        self._mark_dirty(storage_key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(self.key_builder.build(key))).data.copy()
+
+    async def close(self) -> None:
+        # Диспетчер закрывает хранилище сам на shutdown, бот — ещё раз при выходе
+        if self.closed:
+            return
+        self.closed = True
+        if self.flush_task is not None and not self.flush_task.done():
+            self.flush_task.cancel()
+        await self.flush()
+        if self.backend is not None:
+            await self.backend.close()
+
+
+def create_storage(kind: str, ttl: Optional[float], max_keys: int,
+                   sqlite_path: str = "fsm.sqlite3", redis=None, shared: bool = False) -> TieredStorage:
+    """
+    Хранилище FSM по конфигурации: memory, sqlite или redis (redis — клиент
+    redis.asyncio). shared — хранилище делят несколько процессов бота.
+    """
+    flush_interval = 0 if shared else 0.05
+    if kind == "memory":
+        if shared:
+            raise ValueError("FSM storage 'memory' cannot be shared between processes")
+        return TieredStorage(None, ttl=ttl, max_keys=max_keys)
+    if kind == "sqlite":
+        return TieredStorage(SQLiteBackend(sqlite_path), ttl=ttl, max_keys=max_keys,
+                             flush_interval=flush_interval, shared=shared)
+    if kind == "redis":
+        return TieredStorage(RedisBackend(redis), ttl=ttl, max_keys=max_keys,
+                             flush_interval=flush_interval, shared=shared)
+    raise ValueError(f"Unknown FSM storage: {kind}")
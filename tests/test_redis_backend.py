@@ -0,0 +1,186 @@
+"""
+FSM-хранилище и rate limiter на Redis — против fakeredis (Lua-скрипты
+лимитера требуют fakeredis[lua]):
+
+    pip install -r requirements-dev.txt
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+
+from ratelimit import RedisRateLimiter  # noqa: E402
+from storage import RedisBackend, TieredStorage  # noqa: E402
+
+
+def storage_key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+class CountingRedis(fakeredis.aioredis.FakeRedis):
+    """FakeRedis, который считает пайплайны — так видно, что бэкенд ходит пачками"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pipelines = 0
+
+    def pipeline(self, *args, **kwargs):
+        self.pipelines += 1
+        return super().pipeline(*args, **kwargs)
+
+
+def make_storage(redis, **kwargs) -> TieredStorage:
+    return TieredStorage(RedisBackend(redis), flush_interval=0, **kwargs)
+
+
+def test_state_and_data_persist_in_redis():
+    async def scenario():
+        redis = CountingRedis(decode_responses=True)
+        storage = make_storage(redis)
+        await storage.set_state(storage_key(1), "SearchFlow:input_query")
+        await storage.set_data(storage_key(1), {"type": "web"})
+        await storage.flush()
+
+        # Новое хранилище (другой процесс) читает то же из Redis
+        other = make_storage(redis)
+        assert await other.get_state(storage_key(1)) == "SearchFlow:input_query"
+        assert await other.get_data(storage_key(1)) == {"type": "web"}
+
+        await storage.set_state(storage_key(1), None)
+        await storage.set_data(storage_key(1), {})
+        await storage.flush()
+        assert await redis.keys("*") == []
+
+    asyncio.run(scenario())
+
+
+def test_reads_of_one_iteration_go_in_one_round_trip():
+    async def scenario():
+        redis = CountingRedis(decode_responses=True)
+        writer = make_storage(redis)
+        for user_id in range(10):
+            await writer.set_data(storage_key(user_id), {"n": user_id})
+        await writer.flush()
+
+        redis.pipelines = 0
+        reader = make_storage(redis)
+        data = await asyncio.gather(*(reader.get_data(storage_key(user_id)) for user_id in range(10)))
+        assert data == [{"n": user_id} for user_id in range(10)]
+        assert redis.pipelines == 1  # MGET и PTTL всех ключей
+        assert reader.stats["backend_reads"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_writes_are_batched_into_one_pipeline():
+    async def scenario():
+        redis = CountingRedis(decode_responses=True)
+        storage = TieredStorage(RedisBackend(redis), flush_interval=0.05)
+        for user_id in range(10):
+            await storage.set_state(storage_key(user_id), "SearchFlow:show_more")
+            await storage.set_data(storage_key(user_id), {"shown": 10})
+        assert await redis.keys("*") == []  # write-behind: до сброса в Redis ничего не ушло
+        reads = redis.pipelines
+
+        await asyncio.sleep(0.1)
+        assert redis.pipelines == reads + 1
+        assert storage.stats["backend_writes"] == 1
+        assert len(await redis.keys("*")) == 10
+
+    asyncio.run(scenario())
+
+
+def test_ttl_expires_in_memory_and_in_redis():
+    async def scenario():
+        redis = CountingRedis(decode_responses=True)
+        storage = make_storage(redis, ttl=0.2)
+        await storage.set_state(storage_key(1), "SearchFlow:choose_type")
+        await storage.flush()
+        assert 0 < await redis.pttl(next(iter(await redis.keys("*")))) <= 200
+
+        await asyncio.sleep(0.3)
+        assert await storage.get_state(storage_key(1)) is None
+        assert await make_storage(redis).get_state(storage_key(1)) is None
+        assert await redis.keys("*") == []
+
+    asyncio.run(scenario())
+
+
+def test_session_loaded_from_redis_keeps_its_ttl():
+    async def scenario():
+        redis = CountingRedis(decode_responses=True)
+        writer = make_storage(redis, ttl=0.3)
+        await writer.set_state(storage_key(1), "SearchFlow:show_more")
+        await writer.flush()
+
+        # Другой процесс поднимает сессию из Redis вместе с оставшимся TTL
+        reader = make_storage(redis)
+        assert await reader.get_state(storage_key(1)) == "SearchFlow:show_more"
+        assert 0 < reader.records[reader.key_builder.build(storage_key(1))].expires - time.time() <= 0.3
+
+        await asyncio.sleep(0.4)
+        hits = reader.stats["hits"]
+        assert await reader.get_state(storage_key(1)) is None
+        assert reader.stats["hits"] == hits + 1  # истекла в памяти, без похода в Redis
+
+    asyncio.run(scenario())
+
+
+def test_eviction_keeps_memory_bounded_without_losing_sessions():
+    async def scenario():
+        redis = CountingRedis(decode_responses=True)
+        storage = make_storage(redis, max_keys=5)
+        for user_id in range(20):
+            await storage.set_data(storage_key(user_id), {"n": user_id})
+            await storage.flush()
+        assert len(storage.records) <= 5
+        assert storage.stats["evicted"] >= 15
+
+        # Вытесненные из памяти сессии поднимаются из Redis
+        assert await storage.get_data(storage_key(0)) == {"n": 0}
+        assert len(storage.records) <= 5
+
+    asyncio.run(scenario())
+
+
+def test_shared_storage_sees_other_process_writes():
+    async def scenario():
+        redis = CountingRedis(decode_responses=True)
+        first = make_storage(redis, shared=True)
+        second = make_storage(redis, shared=True)
+        await first.set_data(storage_key(1), {"query": "кнопка"})
+        await first.flush()
+        assert await second.get_data(storage_key(1)) == {"query": "кнопка"}
+
+        await second.set_data(storage_key(1), {"query": "поле"})
+        await second.flush()
+        assert await first.get_data(storage_key(1)) == {"query": "поле"}
+
+    asyncio.run(scenario())
+
+
+def test_redis_rate_limiter_bucket():
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        limiter = RedisRateLimiter(redis, "message", rate=10, burst=3)
+        assert [await limiter.allow("u1") for _ in range(4)] == [True, True, True, False]
+        assert limiter.rejected == 1
+        assert await limiter.allow("u2")  # у другого ключа своё ведро
+
+        await asyncio.sleep(0.15)  # за 0.1 с при rate=10 набегает токен
+        assert await limiter.allow("u1")
+
+        # Простаивающее ведро Redis удаляет сам через burst / rate секунд
+        assert 0 < await redis.pttl("ratelimit:message:u1") <= 300
+
+    asyncio.run(scenario())